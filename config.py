@@ -5,5 +5,9 @@ DATABASE_USER = os.getenv('DATABASE_USER')
 DATABASE_PASSWORD = os.getenv('DATABASE_PASSWORD')
 DATABASE_HOST = '127.0.0.1'
 DATABASE_PORT = '5432'
+DATABASE_MIN_POOL_SIZE = 1
+DATABASE_MAX_POOL_SIZE = 10
+DATABASE_POOL_IDLE_TIMEOUT = 300.0
+DATABASE_PREPARE_THRESHOLD = 5
 STATIC_SALT = os.getenv('STATIC_SALT')
 KEY_TO_CREATE_ADMINISTRATOR = os.getenv('KEY_TO_CREATE_ADMINISTRATOR')
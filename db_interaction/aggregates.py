@@ -0,0 +1,85 @@
+from typing import Optional
+
+from psycopg2.sql import Identifier
+
+from other.utils import get_identifiers, get_table_and_column_for_condition
+
+
+class Aggregate:
+    """
+    Агрегатная функция SQL над полем модели. Поле указывается так же, как в условиях выборки
+    (например, Avg('value') или Count('student', distinct=True)).
+    Используется в методах 'aggregate' и 'annotate' класса 'QuerySet'
+    """
+
+    function: Optional[str] = None
+
+    def __init__(self, field: str = 'pk', distinct: bool = False) -> None:
+        self.field = field
+        self.distinct = distinct
+
+    @property
+    def default_alias(self) -> str:
+        return f'{self.field}__{self.function.lower()}'
+
+    def get_sql(self, model: type) -> tuple[str, list[Identifier]]:
+        """Возвращает SQL агрегатной функции (без форматирования) и его идентификаторы"""
+        distinct = 'DISTINCT ' if self.distinct else ''
+        return f'{self.function}({distinct}{{}}.{{}})', get_identifiers(*get_table_and_column_for_condition(model,
+                                                                                                         self.field))
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and (self.field, self.distinct) == (other.field, other.distinct)
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.field, self.distinct))
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.field!r})'
+
+
+class Avg(Aggregate):
+    """Среднее значение поля. Приводится к float: AVG целых чисел в PostgreSQL - numeric (Decimal в Python)"""
+
+    function = 'AVG'
+
+    def get_sql(self, model: type) -> tuple[str, list[Identifier]]:
+        s, identifiers = super().get_sql(model)
+        return f'{s}::float', identifiers
+
+
+class Min(Aggregate):
+    function = 'MIN'
+
+
+class Max(Aggregate):
+    function = 'MAX'
+
+
+class Count(Aggregate):
+    function = 'COUNT'
+
+
+class Sum(Aggregate):
+    function = 'SUM'
+
+
+class ArrayAgg(Aggregate):
+    """Массив значений поля в группе, упорядоченный по полю 'ordering' (по умолчанию - в порядке создания записей)"""
+
+    function = 'ARRAY_AGG'
+
+    def __init__(self, field: str = 'pk', distinct: bool = False, ordering: str = 'pk') -> None:
+        super().__init__(field, distinct)
+        self.ordering = ordering
+
+    def get_sql(self, model: type) -> tuple[str, list[Identifier]]:
+        s, identifiers = super().get_sql(model)
+        ordering_identifiers = get_identifiers(*get_table_and_column_for_condition(model, self.ordering))
+        return f'{s[:-1]} ORDER BY {{}}.{{}})', identifiers + ordering_identifiers
+
+    def __eq__(self, other: object) -> bool:
+        return super().__eq__(other) and self.ordering == other.ordering
+
+    def __hash__(self) -> int:
+        return hash((super().__hash__(), self.ordering))
@@ -0,0 +1,106 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+import aiopg
+
+from db_interaction.manage_db import confirm_executed_requests
+from other.data_structures import Request
+
+
+class AsyncDatabase:
+    """
+    Асинхронный вариант класса 'Database' на aiopg для асинхронного сервера,
+    в котором много пользователей работают одновременно без отдельного потока на каждого.
+
+    Запросы исполняются сразу, без очереди, каждый - в соединении из пула aiopg.
+    Внутри блока 'async with database.transaction()' все запросы задачи исполняются
+    в одном соединении и одной транзакции, которая откатывается при исключении.
+    Перед работой нужно открыть пул соединений: 'await database.connect()'
+    """
+
+    def __init__(self, database: str,
+                 user: str, password: str,
+                 host: str, port: str,
+                 min_pool_size: int = 1, max_pool_size: int = 10) -> None:
+        self.__data_for_conn = {'database': database, 'user': user, 'password': password,
+                                'host': host, 'port': port}
+        self.__min_pool_size = min_pool_size
+        self.__max_pool_size = max_pool_size
+        self.__pool: Optional[aiopg.Pool] = None
+        self.__transaction_cursor: ContextVar[Optional[aiopg.Cursor]] = ContextVar('transaction_cursor',
+                                                                                  default=None)
+        self.__transaction_requests: ContextVar[list[Request]] = ContextVar('transaction_requests')
+
+    async def connect(self) -> None:
+        self.__pool = await aiopg.create_pool(minsize=self.__min_pool_size, maxsize=self.__max_pool_size,
+                                              **self.__data_for_conn)
+
+    @asynccontextmanager
+    async def __get_cursor(self) -> AsyncIterator[aiopg.Cursor]:
+        """Курсор текущей транзакции или, вне транзакции, курсор соединения из пула"""
+        cur = self.__transaction_cursor.get()
+        if cur is not None:
+            yield cur
+            return
+        async with self.__pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                yield cur
+
+    async def fetch(self, request: Request) -> list[tuple]:
+        """Исполняет запрос с выводом и возвращает его вывод"""
+        async with self.__get_cursor() as cur:
+            await cur.execute(request.sql, request.args)
+            output = await cur.fetchall()
+        if request.output is not None:
+            request.output.set_output(output)
+        self.__confirm(request)
+        return output
+
+    async def execute(self, request: Request) -> None:
+        """Исполняет запрос. Вне транзакции изменения сохраняются сразу"""
+        if request.type == 'with_output':
+            await self.fetch(request)
+            return
+        async with self.__get_cursor() as cur:
+            await cur.execute(request.sql, request.args)
+        self.__confirm(request)
+
+    def __confirm(self, request: Request) -> None:
+        """Вывод запроса получает уведомление, когда изменения зафиксированы: вне транзакции - сразу"""
+        if self.__transaction_cursor.get() is not None:
+            self.__transaction_requests.get().append(request)
+        else:
+            confirm_executed_requests([request])
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Транзакция текущей задачи. Вложенный блок 'transaction' исполняется во внешней транзакции"""
+        if self.__transaction_cursor.get() is not None:
+            yield
+            return
+        async with self.__pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                requests_token = self.__transaction_requests.set([])
+                try:
+                    async with cur.begin():
+                        token = self.__transaction_cursor.set(cur)
+                        try:
+                            yield
+                        finally:
+                            self.__transaction_cursor.reset(token)
+                    confirm_executed_requests(self.__transaction_requests.get())
+                finally:
+                    self.__transaction_requests.reset(requests_token)
+
+    def add_unexecuted_request(self, request: Request) -> None:
+        raise TypeError('Запросы асинхронной БД исполняются через await, например: await query_set')
+
+    def iterate_request(self, request: Request, chunk_size: int) -> None:
+        raise TypeError('Асинхронная БД не поддерживает потоковый перебор записей, используйте срезы набора')
+
+    async def close(self) -> None:
+        """Закрывает все соединения пула"""
+        if self.__pool is not None:
+            self.__pool.close()
+            await self.__pool.wait_closed()
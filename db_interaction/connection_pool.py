@@ -0,0 +1,141 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from psycopg2 import Error
+from psycopg2.extensions import connection, TRANSACTION_STATUS_IDLE
+
+from other.data_structures import PoolStatistics
+from other.exceptions import ConnectionPoolExhausted
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений с базой данных.
+
+    Соединения открываются по мере необходимости, но не более 'max_size' одновременно.
+    Соединение, простаивающее дольше 'idle_timeout' секунд, закрывается, если в пуле
+    остается не меньше 'min_size' соединений. Перед выдачей соединение проверяется:
+    закрытые соединения и соединения с незавершенной транзакцией отбрасываются, а соединение,
+    простаивавшее дольше 'ping_interval' секунд, дополнительно проверяется запросом 'SELECT 1'.
+    Если свободных соединений нет, выдача ждет не дольше 'checkout_timeout' секунд
+    """
+
+    def __init__(self, connect: Callable[[], connection],
+                 min_size: int = 1, max_size: int = 10,
+                 idle_timeout: float = 300.0, ping_interval: float = 30.0,
+                 checkout_timeout: Optional[float] = 30.0) -> None:
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise ValueError('Некорректные размеры пула соединений')
+        self.__connect = connect
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__idle_timeout = idle_timeout
+        self.__ping_interval = ping_interval
+        self.__checkout_timeout = checkout_timeout
+        self.__idle: list[tuple[connection, float]] = []
+        self.__size = 0
+        self.__condition = threading.Condition()
+        self.__checkouts = self.__waits = self.__connects = self.__discards = 0
+
+    def getconn(self) -> connection:
+        """Выдает исправное соединение из пула, при необходимости открывая новое"""
+        with self.__condition:
+            self.__checkouts += 1
+        while True:
+            conn, idle_since = self.__take_idle_connection_or_reserve_place()
+            if conn is None:
+                return self.__open_connection()
+            if self.__is_healthy(conn, idle_since):
+                return conn
+            self.__discard(conn)
+
+    def putconn(self, conn: connection) -> None:
+        """Возвращает соединение в пул. Незавершенная транзакция откатывается"""
+        if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Error:
+                pass
+        if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            self.__discard(conn)
+            return
+        with self.__condition:
+            self.__idle.append((conn, time.monotonic()))
+            self.__close_expired_connections()
+            self.__condition.notify()
+
+    def closeall(self) -> None:
+        """Закрывает все свободные соединения"""
+        with self.__condition:
+            while self.__idle:
+                self.__close(self.__idle.pop()[0])
+
+    @property
+    def statistics(self) -> PoolStatistics:
+        with self.__condition:
+            return PoolStatistics(self.__checkouts, self.__waits, self.__connects,
+                                  self.__discards, self.__size, len(self.__idle))
+
+    def __take_idle_connection_or_reserve_place(self) -> tuple[Optional[connection], float]:
+        """
+        Возвращает последнее вернувшееся в пул соединение. Если свободных соединений нет,
+        резервирует место под новое соединение и возвращает (None, 0)
+        """
+        with self.__condition:
+            self.__close_expired_connections()
+            deadline = None if self.__checkout_timeout is None else time.monotonic() + self.__checkout_timeout
+            while not self.__idle and self.__size >= self.__max_size:
+                self.__waits += 1
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0 or not self.__condition.wait(timeout):
+                    raise ConnectionPoolExhausted
+            if self.__idle:
+                return self.__idle.pop()
+            self.__size += 1
+            return None, 0
+
+    def __open_connection(self) -> connection:
+        try:
+            conn = self.__connect()
+        except Exception:
+            with self.__condition:
+                self.__size -= 1
+                self.__condition.notify()
+            raise
+        with self.__condition:
+            self.__connects += 1
+        return conn
+
+    def __is_healthy(self, conn: connection, idle_since: float) -> bool:
+        if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - idle_since < self.__ping_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+        except Error:
+            return False
+        return True
+
+    def __discard(self, conn: connection) -> None:
+        with self.__condition:
+            self.__close(conn)
+            self.__condition.notify()
+
+    def __close(self, conn: connection) -> None:
+        """Закрывает соединение. Вызывается только при захваченной блокировке"""
+        try:
+            conn.close()
+        except Error:
+            pass
+        self.__size -= 1
+        self.__discards += 1
+
+    def __close_expired_connections(self) -> None:
+        """Закрывает давно простаивающие соединения. Вызывается только при захваченной блокировке"""
+        expiration_time = time.monotonic() - self.__idle_timeout
+        while self.__idle and self.__size > self.__min_size and self.__idle[0][1] < expiration_time:
+            self.__close(self.__idle.pop(0)[0])
@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from other.data_structures import IdentityMap
+
+_session_identity_map: ContextVar[Optional[IdentityMap]] = ContextVar('session_identity_map', default=None)
+
+
+@contextmanager
+def session() -> Iterator[IdentityMap]:
+    """
+    Сессия работы с БД. Все модели, полученные из БД внутри блока 'with session()', берутся из одной
+    карты соответствия, поэтому запись, выбранная несколькими запросами, представлена одним объектом.
+    Вне сессии объекты объединяются только в пределах вывода одного запроса
+    """
+    token = _session_identity_map.set(IdentityMap())
+    try:
+        yield _session_identity_map.get()
+    finally:
+        _session_identity_map.reset(token)
+
+
+def get_session_identity_map() -> Optional[IdentityMap]:
+    """Возвращает карту соответствия текущей сессии (None вне сессии)"""
+    return _session_identity_map.get()
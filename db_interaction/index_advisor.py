@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Советник по индексам. Прогоняет запросы, которые генерирует ORM на основных экранах приложения,
+через 'EXPLAIN' и сообщает о последовательном сканировании (Seq Scan) больших таблиц.
+Запросы строятся теми же функциями, что используют экраны, поэтому список не устаревает.
+
+Запуск: python -m db_interaction.index_advisor [минимальное число строк в таблице]
+"""
+
+import sys
+from typing import Iterable, Iterator
+
+import psycopg2
+from psycopg2.extensions import cursor
+from psycopg2.sql import SQL
+
+from config import *
+from db_interaction.manage_db import Database
+from db_interaction.working_with_data import TablesManager
+from other.data_structures import Request, SeqScanReport
+from other.utils import get_trusted_model
+from user_interaction.services import State, get_class_students, get_student_grades, get_class_subjects, \
+    get_teacher_subjects, get_classes_of_classroom_teacher, get_class_gradebook, set_current_dates_to_state
+from working_with_models.models import Student, Class, Subject, Teacher, Period
+
+min_table_rows_to_report = 10_000
+
+
+def get_hot_requests(sample_pk: int = 1) -> list[Request]:
+    """
+    Запросы основных экранов приложения для образцов объектов с первичным ключом 'sample_pk'
+    и текущего периода ('State.current_period'). Запросы не исполняются
+    """
+    student, school_class, subject, teacher = (get_trusted_model(model, iter((sample_pk,)), ('pk',))
+                                               for model in (Student, Class, Subject, Teacher))
+    query_sets = [
+        get_student_grades(student),
+        get_class_gradebook(school_class, subject),
+        get_class_students(school_class),
+        get_teacher_subjects(teacher),
+        get_class_subjects(school_class),
+        get_classes_of_classroom_teacher(teacher)
+    ]
+    return [query_set.get_request() for query_set in query_sets]
+
+
+def iter_plan_nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for subplan in plan.get('Plans', ()):
+        yield from iter_plan_nodes(subplan)
+
+
+def explain_request(cur: cursor, request: Request) -> dict:
+    """Возвращает корневой узел плана запроса (без его выполнения)"""
+    cur.execute(SQL('EXPLAIN (FORMAT JSON) ') + request.sql, request.args)
+    return cur.fetchone()[0][0]['Plan']
+
+
+def get_table_rows(cur: cursor, table: str) -> int:
+    """Оценка числа строк таблицы по статистике PostgreSQL"""
+    cur.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', (table,))
+    row = cur.fetchone()
+    return max(row[0], 0) if row else 0
+
+
+def find_seq_scans(cur: cursor, requests: Iterable[Request],
+                   min_table_rows: int = min_table_rows_to_report) -> list[SeqScanReport]:
+    reports = []
+    for request in requests:
+        for node in iter_plan_nodes(explain_request(cur, request)):
+            if node['Node Type'] != 'Seq Scan':
+                continue
+            table_rows = get_table_rows(cur, node['Relation Name'])
+            if table_rows >= min_table_rows:
+                reports.append(SeqScanReport(node['Relation Name'], table_rows, node.get('Filter'),
+                                             request.sql.as_string(cur)))
+    return reports
+
+
+def print_reports(reports: list[SeqScanReport]) -> None:
+    if not reports:
+        print('Последовательное сканирование больших таблиц не найдено')
+    for report in reports:
+        print(f'Seq Scan по таблице {report.table} (~{report.table_rows} строк)')
+        print(f'    фильтр: {report.filter}')
+        print(f'    запрос: {report.sql}')
+
+
+def main() -> None:
+    min_table_rows = int(sys.argv[1]) if len(sys.argv) > 1 else min_table_rows_to_report
+    db = Database(DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST, DATABASE_PORT)
+    TablesManager(db)
+    set_current_dates_to_state(Period.manager.get(is_current=True))
+    db.close()
+    conn = psycopg2.connect(database=DATABASE_NAME, user=DATABASE_USER, password=DATABASE_PASSWORD,
+                            host=DATABASE_HOST, port=DATABASE_PORT)
+    try:
+        with conn.cursor() as cur:
+            print_reports(find_seq_scans(cur, get_hot_requests(), min_table_rows))
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
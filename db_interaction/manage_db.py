@@ -1,24 +1,46 @@
+from collections import OrderedDict
 from functools import wraps
-from typing import Callable
+from itertools import count
+from typing import Callable, Optional, Iterator
 
 import psycopg2
 import psycopg2.extras
-from psycopg2.extensions import cursor
+from psycopg2.extensions import cursor, connection
+from psycopg2.sql import SQL, Identifier, Placeholder, Composable
 
-from other.data_structures import Request
+from db_interaction.connection_pool import ConnectionPool
+from other.data_structures import Request, PoolStatistics, DeferredOutput, StatementUsage
 from other.exceptions import DontExistUnexecutedRequests
-from other.utils import Singleton
+from other.utils import Singleton, get_sql_with_numbered_placeholders, is_select_statement
+
+
+class PreparingConnection(connection):
+    """Соединение, помнящее, какие запросы подготовлены на сервере. 'prepared_statements' - имена запросов"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared_statements: set[str] = set()
 
 
 class Database(Singleton):
     """
     Класс, позволяющий работать с базой данных.
-    Совершает обработку запросов, выполненяет транзакции
+    Совершает обработку запросов, выполненяет транзакции.
+    Соединения берутся из пула и возвращаются в него после обработки запросов.
+
+    Если указан 'prepare_threshold', выборка ('SELECT'), исполненная столько раз,
+    подготавливается на сервере ('PREPARE') в каждом соединении, где она исполняется,
+    и далее исполняется командой 'EXECUTE' без повторного планирования.
+    Исполнения учитываются для последних 'statements_usage_size' запросов
     """
 
+    statements_usage_size = 256
+
     def __init__(self, database: str,
                  user: str, password: str,
-                 host: str, port: str) -> None:
+                 host: str, port: str,
+                 min_pool_size: int = 1, max_pool_size: int = 10,
+                 pool_idle_timeout: float = 300.0, prepare_threshold: Optional[int] = None) -> None:
         self.__database = database
         self.__user = user
         self.__password = password
@@ -26,60 +48,180 @@ class Database(Singleton):
         self.__port = port
         self.__unexecuted_requests = []
         self._output = None
-
-    def __connect_to_db(self) -> None:
-        self.conn = psycopg2.connect(database=self.__database,
-                                     user=self.__user,
-                                     password=self.__password,
-                                     host=self.__host,
-                                     port=self.__port)
-
-    def add_unexecuted_request(self, request: Request) -> None:
+        self.conn = None
+        self.__prepare_threshold = prepare_threshold
+        self.__statements_usage: OrderedDict[int, StatementUsage] = OrderedDict()
+        self.__statements_numbers = count(1)
+        self.__cursors_count = 0
+        self.__pool = ConnectionPool(self.__connect_to_db, min_pool_size, max_pool_size, pool_idle_timeout)
+
+    def __connect_to_db(self) -> connection:
+        return psycopg2.connect(database=self.__database,
+                                user=self.__user,
+                                password=self.__password,
+                                host=self.__host,
+                                port=self.__port,
+                                connection_factory=PreparingConnection)
+
+    def add_unexecuted_request(self, request: Request) -> Optional[DeferredOutput]:
+        """Добавляет запрос в очередь. Для запроса с выводом возвращает его будущий вывод"""
         if not isinstance(request, Request):
             raise TypeError('Запрос не является экземпляром класса \'Request\'')
+        if request.type == 'with_output' and request.output is None:
+            request = request._replace(output=DeferredOutput(self))
         self.__unexecuted_requests.append(request)
+        return request.output
 
     def check_to_requests_exist(self) -> None:
         if not self.__unexecuted_requests:
             raise DontExistUnexecutedRequests
 
+    def __get_statement_usage(self, sql: Composable) -> StatementUsage:
+        """
+        Возвращает учет исполнений запроса. Запросы одной формы - один и тот же объект SQL из кэша
+        'RequestFactory', поэтому учет ведется по объекту и строка SQL не вычисляется при каждом исполнении
+        """
+        key = id(sql)
+        usage = self.__statements_usage.get(key)
+        if usage is None:
+            usage = self.__statements_usage[key] = StatementUsage(sql)
+            if len(self.__statements_usage) > self.statements_usage_size:
+                self.__statements_usage.popitem(last=False)
+        else:
+            self.__statements_usage.move_to_end(key)
+        return usage
+
+    @staticmethod
+    def __prepare_statement(cur: cursor, sql: Composable, name: str) -> None:
+        sql_with_parameters, _ = get_sql_with_numbered_placeholders(sql.as_string(cur))
+        cur.execute(SQL('PREPARE {} AS ').format(Identifier(name)) + SQL(sql_with_parameters))
+        cur.connection.prepared_statements.add(name)
+
+    def __get_sql_to_execute(self, cur: cursor, request: Request) -> Composable:
+        """Возвращает SQL запроса или, если выборка исполняется часто, команду исполнения подготовленного запроса"""
+        prepared_statements = getattr(cur.connection, 'prepared_statements', None)
+        if self.__prepare_threshold is None or prepared_statements is None or not is_select_statement(request.sql):
+            return request.sql
+        usage = self.__get_statement_usage(request.sql)
+        usage.count += 1
+        if usage.name is None:
+            if usage.count < self.__prepare_threshold:
+                return request.sql
+            usage.name = f'web_education_{next(self.__statements_numbers)}'
+        if usage.name not in prepared_statements:
+            self.__prepare_statement(cur, request.sql, usage.name)
+        if not request.args:
+            return SQL('EXECUTE {}').format(Identifier(usage.name))
+        return SQL('EXECUTE {} ({})').format(Identifier(usage.name), SQL(', ').join(Placeholder() * len(request.args)))
+
     def __execute_one_request(self, cur: cursor, request: Request) -> None:
-        cur.execute(*request[:2])
+        cur.execute(self.__get_sql_to_execute(cur, request), request.args)
         if request.type == 'with_output':
             self._output = cur.fetchall()
-
-    def __execute_requests(self, cur: cursor) -> None:
-        for request in self.__unexecuted_requests:
-            self.__execute_one_request(cur, request)
+            if request.output is not None:
+                request.output.set_output(self._output)
+
+    def __execute_batch_of_requests(self, cur: cursor, requests: list[Request]) -> None:
+        if len(requests) == 1:
+            self.__execute_one_request(cur, requests[0])
+            return
+        psycopg2.extras.execute_batch(cur, requests[0].sql, [request.args for request in requests])
+
+    def __execute_requests(self, cur: cursor) -> list[Request]:
+        executed_requests = self.__unexecuted_requests
+        for requests in group_requests_for_batch_execution(executed_requests):
+            self.__execute_batch_of_requests(cur, requests)
         self.__unexecuted_requests = []
+        return executed_requests
 
-    def __processing_requests(self) -> None:
+    def __processing_requests(self) -> list[Request]:
         with self.conn.cursor() as cur:
-            self.__execute_requests(cur)
+            return self.__execute_requests(cur)
 
     @staticmethod
     def __process_connection(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(self: 'Database') -> None:
             self.check_to_requests_exist()
-            self.__connect_to_db()
-            func(self)
-            self.conn.close()
+            self.conn = self.__pool.getconn()
+            try:
+                func(self)
+            finally:
+                self.__pool.putconn(self.conn)
+                self.conn = None
 
         return wrapper
 
     @__process_connection
     def execute_requests(self) -> None:
-        self.__processing_requests()
+        executed_requests = self.__processing_requests()
         self.conn.commit()
+        confirm_executed_requests(executed_requests)
 
     @__process_connection
     def execute_transaction(self) -> None:
         with self.conn:
-            self.__processing_requests()
+            executed_requests = self.__processing_requests()
+        confirm_executed_requests(executed_requests)
+
+    def iterate_request(self, request: Request, chunk_size: int = 2000) -> Iterator[list[tuple]]:
+        """
+        Исполняет запрос с выводом на именованном (серверном) курсоре и возвращает его вывод
+        частями по 'chunk_size' строк, не загружая весь вывод в память.
+        Запрос исполняется в отдельном соединении из пула, очередь запросов не затрагивается
+        """
+        if request.type != 'with_output':
+            raise ValueError('Итерировать можно только запрос с выводом')
+        conn = self.__pool.getconn()
+        self.__cursors_count += 1
+        try:
+            with conn.cursor(name=f'web_education_cursor_{self.__cursors_count}') as cur:
+                cur.itersize = chunk_size
+                cur.execute(request.sql, request.args)
+                while rows := cur.fetchmany(chunk_size):
+                    yield rows
+            conn.commit()
+        finally:
+            self.__pool.putconn(conn)
 
     @property
     def output(self) -> list[tuple]:
         result = self._output
         self._output = None
         return result
+
+    @property
+    def pool_statistics(self) -> PoolStatistics:
+        return self.__pool.statistics
+
+    def close(self) -> None:
+        """Закрывает все свободные соединения пула"""
+        self.__pool.closeall()
+
+
+def confirm_executed_requests(requests: list[Request]) -> None:
+    """
+    Сообщает выводам исполненных запросов, что изменения зафиксированы в БД
+    (например, чтобы созданная модель получила первичный ключ, а сохраненная - запомнила записанные значения)
+    """
+    for request in requests:
+        if request.output is None:
+            continue
+        if request.type == 'without_output':
+            request.output.set_output([])
+        request.output.confirm()
+
+
+def group_requests_for_batch_execution(requests: list[Request]) -> list[list[Request]]:
+    """
+    Группирует подряд идущие запросы без вывода с одинаковым SQL, чтобы отправить их в БД одним пакетом.
+    Порядок запросов сохраняется
+    """
+    batches = []
+    for request in requests:
+        if batches and request.type == 'without_output' and batches[-1][-1].type == 'without_output' \
+                and batches[-1][-1].sql == request.sql:
+            batches[-1].append(request)
+        else:
+            batches.append([request])
+    return batches
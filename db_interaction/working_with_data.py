@@ -1,24 +1,58 @@
-from typing import Callable
+from collections import defaultdict
+from functools import partial, lru_cache
+from typing import Callable, Optional, Type, Any, Iterator, Iterable, Generator, Awaitable, TYPE_CHECKING
 
 from db_interaction.manage_db import Database
-from other.data_structures import Request
+from db_interaction.aggregates import Aggregate, Count
+from db_interaction.identity_map import get_session_identity_map
+from other.data_structures import Request, DeferredOutput, Prefetch, IdentityMap
 from other.utils import *
-from working_with_models.models import BaseModel
+from working_with_models.models import BaseModel, ReverseRelation
+
+if TYPE_CHECKING:
+    from db_interaction.async_manage_db import AsyncDatabase
 
 
 class RequestFactory:
-    __all_columns = 'SELECT * FROM {}'
+    """
+    Класс, создающий запросы к БД.
+
+    SQL запроса зависит только от класса модели, метода и имен столбцов (условий выборки),
+    поэтому скомпилированный SQL кэшируется (LRU), а при повторных запросах вычисляются только аргументы.
+    Статистику кэша возвращает метод 'statement_cache_info'
+    """
+
     __update_part = 'UPDATE {}'
     __delete_part = 'DELETE FROM {}'
+    statement_cache_size = 256
+
+    @classmethod
+    def select(cls, model: BaseModel, where: tuple[tuple[bool, dict[str, ModelValuesTypes]], ...] = (),
+               ordering: tuple[str, ...] = (), limit: Optional[int] = None, offset: int = 0,
+               fields: tuple[str, ...] = (), aggregates: tuple[Aggregate, ...] = ()) -> Request:
+        """
+        Запрос, возвращающий записи, удовлетворяющие группам условий 'where', из БД.
+        Условия внутри группы объединяются 'AND', группы - тоже 'AND'.
+        Группа, помеченная True, отрицается (так работает метод 'exclude').
+        'ordering' - поля, по которым сортируются записи, 'limit' и 'offset' - количество
+        возвращаемых и пропускаемых записей.
+        'fields' - поля, которые нужно выбрать (например, ('pk', 'subject__name')), по умолчанию -
+        поля главной и связанных моделей, кроме отложенных ('deferred_fields' моделей).
+        'aggregates' - агрегатные функции, значения которых выбираются после полей. Если указаны и поля,
+        и агрегаты, записи группируются по полям ('GROUP BY'), если только агрегаты - выбирается одна строка.
+        Запрос присоединяет только те таблицы, к которым обращаются поля, условия и сортировка
+        """
+
+        if not fields and not aggregates:
+            fields = get_fields_to_load(get_model_class(model))
+        shape, arguments = cls.__get_shape_and_arguments_of_selection(model, where, ordering, limit, offset, fields,
+                                                                      aggregates)
+        return Request(cls.__get_sql(get_model_class(model), 'select', shape), arguments, 'with_output')
 
     @classmethod
     def all(cls, model: BaseModel) -> Request:
         """Запрос, возвращающий все записи из БД"""
-
-        join_part, identifiers_for_join = get_data_for_join_part_of_sql(model)
-        identifiers = get_identifiers(model.db_table) + identifiers_for_join
-        sql = get_sql(identifiers, cls.__all_columns, join_part)
-        return Request(sql, [], 'with_output')
+        return cls.select(model)
 
     @classmethod
     def filter(cls, model: BaseModel, **kwargs) -> Request:
@@ -30,13 +64,7 @@ class RequestFactory:
         чтобы применить условия к полям связанной модели. Префикс от условия
         отделяется двумя нижними подчеркиваниями '__'. Например: 'model__name'
         """
-
-        join_part, identifiers_for_join = get_data_for_join_part_of_sql(model)
-        where_part, identifiers_for_where, arguments = get_data_for_where_part_of_sql(model, **kwargs)
-        identifiers = get_identifiers(model.db_table) + identifiers_for_join + \
-                      identifiers_for_where + get_identifiers(model.db_table, 'id')
-        sql = get_sql(identifiers, cls.__all_columns, join_part, where_part)
-        return Request(sql, arguments, 'with_output')
+        return cls.select(model, ((False, kwargs),))
 
     @classmethod
     def get(cls, model: BaseModel, **kwargs) -> Request:
@@ -44,37 +72,193 @@ class RequestFactory:
         return cls.filter(model, **kwargs)
 
     @classmethod
-    def save(cls, model: BaseModel) -> Request:
-        """Запрос, сохраняющий все изменения модели. Присутствие атрибута 'pk' в модели обязательно"""
+    def save(cls, model: BaseModel) -> Optional[Request]:
+        """
+        Запрос, сохраняющий изменения модели: записываются только атрибуты, изменившиеся после загрузки
+        модели из БД (у модели не из БД - все атрибуты). Если ничего не изменилось, возвращает None.
+        Присутствие атрибута 'pk' в модели обязательно
+        """
 
-        set_part, identifiers_for_set, arguments_set = get_data_for_set_part_of_sql(model)
-        where_part, identifiers_for_where, argument_where = get_data_for_where_part_of_sql(model, pk=model.pk)
-        identifiers = [Identifier(model.db_table)] + identifiers_for_set + identifiers_for_where
-        sql = get_sql(identifiers, cls.__update_part, set_part, where_part)
-        return Request(sql, arguments_set + argument_where, 'without_output')
+        columns, arguments = get_changed_data_to_write_to_db(model)
+        if not columns:
+            return None
+        sql = cls.__get_sql(get_model_class(model), 'save', tuple(columns))
+        return Request(sql, arguments + [model.pk], 'without_output')
 
-    @staticmethod
-    def create(model: BaseModel) -> Request:
+    @classmethod
+    def create(cls, model: BaseModel) -> Request:
         """
-        Запрос, создающий новую запись в БД
+        Запрос, создающий новую запись в БД и возвращающий ее сгенерированный первичный ключ
         Для этого запроса в полях внешних ключей нужно указывать
         либо pk записи связанной таблицы, либо экземпляр модели, с присутсвующим pk
         """
 
         columns, arguments = get_data_to_write_to_db(model)
-        columns_sql, arguments_sql = get_strings_for_sql(len(arguments))
-        identifiers = get_identifiers(model.db_table, *columns)
-        sql = get_sql_for_creation_method(columns_sql, arguments_sql, identifiers)
-        return Request(sql, arguments, 'without_output')
+        sql = cls.__get_sql(get_model_class(model), 'create', tuple(columns))
+        return Request(sql, arguments, 'with_output')
 
     @classmethod
     def delete(cls, model: 'BaseModel'):
         """Запрос, удаляющий запись из БД"""
+        return Request(cls.__get_sql(get_model_class(model), 'delete'), [model.pk], 'without_output')
 
-        where_part, identifiers_for_where, argument = get_data_for_where_part_of_sql(model, pk=model.pk)
+    @classmethod
+    def bulk_create(cls, model: Type[BaseModel], objs: list[BaseModel]) -> Request:
+        """
+        Запрос, создающий несколько записей в БД одним запросом ('INSERT ... VALUES (...), (...)').
+        Запрос возвращает сгенерированные первичные ключи в порядке 'objs'
+        """
+
+        rows = [get_data_to_write_to_db(obj) for obj in objs]
+        columns = rows[0][0]
+        if any(row_columns != columns for row_columns, _ in rows):
+            raise ValueError('У объектов должны быть заполнены одни и те же поля')
+        sql = cls.__get_sql(model, 'bulk_create', (tuple(columns), len(rows)))
+        return Request(sql, [argument for _, arguments in rows for argument in arguments], 'with_output')
+
+    @classmethod
+    def bulk_update(cls, model: Type[BaseModel], objs: list[BaseModel], fields: Iterable[str]) -> Request:
+        """Запрос, сохраняющий поля 'fields' нескольких записей одним запросом ('UPDATE ... FROM (VALUES ...)')"""
+
+        arguments = []
+        for obj in objs:
+            columns, values = get_data_to_write_to_db_for_fields(obj, fields, dict(obj))
+            arguments += [obj.pk] + values
+        sql = cls.__get_sql(model, 'bulk_update', (tuple(columns), len(objs)))
+        return Request(sql, arguments, 'without_output')
+
+    @classmethod
+    def delete_selected(cls, model: Type[BaseModel], where: tuple[tuple[bool, dict[str, ModelValuesTypes]], ...] = (),
+                        ordering: tuple[str, ...] = (), limit: Optional[int] = None, offset: int = 0) -> Request:
+        """Запрос, удаляющий все записи, которые вернул бы запрос 'select' с теми же аргументами"""
+
+        shape, arguments = cls.__get_shape_and_arguments_of_selection(model, where, ordering, limit, offset)
+        return Request(cls.__get_sql(model, 'delete_selected', shape), arguments, 'without_output')
+
+    @classmethod
+    def update_selected(cls, model: Type[BaseModel], values: dict[str, ModelValuesTypes],
+                        where: tuple[tuple[bool, dict[str, ModelValuesTypes]], ...] = (),
+                        ordering: tuple[str, ...] = (), limit: Optional[int] = None, offset: int = 0) -> Request:
+        """
+        Запрос, присваивающий полям значения из словаря 'values' у всех записей,
+        которые вернул бы запрос 'select' с теми же аргументами
+        """
+
+        columns, arguments = get_data_to_write_to_db_for_fields(model, values, values)
+        shape, arguments_for_selection = cls.__get_shape_and_arguments_of_selection(model, where, ordering,
+                                                                                    limit, offset)
+        sql = cls.__get_sql(model, 'update_selected', (tuple(columns), shape))
+        return Request(sql, arguments + arguments_for_selection, 'without_output')
+
+    @classmethod
+    def statement_cache_info(cls):
+        return cls.__get_sql.cache_info()
+
+    @classmethod
+    def statement_cache_clear(cls) -> None:
+        cls.__get_sql.cache_clear()
+
+    @staticmethod
+    def __get_shape_and_arguments_of_selection(model: BaseModel,
+                                               where: tuple[tuple[bool, dict[str, ModelValuesTypes]], ...],
+                                               ordering: tuple[str, ...], limit: Optional[int],
+                                               offset: int, fields: tuple[str, ...] = (),
+                                               aggregates: tuple[Aggregate, ...] = ()) \
+            -> tuple[tuple, list[Union[int, str]]]:
+        """Возвращает форму выборки (все, от чего зависит ее SQL) и аргументы выборки"""
+
+        where = tuple((negated, dict(sorted(conditions.items()))) for negated, conditions in where)
+        where_shape = tuple((negated, get_condition_names(conditions)) for negated, conditions in where)
+        shape = (where_shape, ordering, limit is not None, offset > 0, fields, aggregates)
+        arguments = []
+        for _, conditions in where:
+            arguments += get_arguments_for_where_part(model, conditions, conditions)
+        arguments += [value for value, is_used in ((limit, limit is not None), (offset, offset > 0)) if is_used]
+        return shape, arguments
+
+    @classmethod
+    @lru_cache(maxsize=statement_cache_size)
+    def __get_sql(cls, model: Type[BaseModel], method: str, shape: tuple = ()) -> Composed:
+        """
+        Компилирует SQL запроса. 'shape' - все, от чего зависит SQL, кроме модели и метода
+        (например, имена условий выборки или столбцы, в которые записываются данные)
+        """
+        return getattr(cls, f'_RequestFactory__compile_{method}')(model, shape)
+
+    @staticmethod
+    def __get_sql_for_selection(model: Type[BaseModel], shape: tuple, fields: tuple[str, ...],
+                                aggregates: tuple[Aggregate, ...] = ()) -> tuple[str, list[Identifier]]:
+        """Возвращает SQL выборки полей 'fields' и агрегатов 'aggregates' (без форматирования) и его идентификаторы"""
+        where_shape, ordering, has_limit, has_offset, *_ = shape
+        columns_part, identifiers_for_columns = get_sql_for_columns_part(model, fields, aggregates)
+        names = fields + ordering + tuple(name for _, names in where_shape for name in names) + \
+                tuple(aggregate.field for aggregate in aggregates)
+        related_paths = get_related_paths_for_fields(model, names)
+        join_part, identifiers_for_join = get_data_for_join_part_of_sql(model, related_paths)
+        where_part, identifiers_for_where = get_sql_for_where_part_of_query(model, where_shape)
+        group_by_part, identifiers_for_group_by = get_sql_for_group_by_part(model, fields if aggregates else ())
+        order_by_part, identifiers_for_order_by = get_sql_for_order_by_part(model, ordering)
+        identifiers = identifiers_for_columns + get_identifiers(model.db_table) + identifiers_for_join + \
+                      identifiers_for_where + identifiers_for_group_by + identifiers_for_order_by
+        s = ' '.join(part for part in (columns_part, join_part, where_part, group_by_part, order_by_part,
+                                       get_sql_for_limit_part(has_limit, has_offset)) if part)
+        return s, identifiers
+
+    @classmethod
+    def __compile_select(cls, model: Type[BaseModel], shape: tuple) -> Composed:
+        *_, fields, aggregates = shape
+        s, identifiers = cls.__get_sql_for_selection(model, shape, fields, aggregates)
+        return get_sql(identifiers, s)
+
+    @classmethod
+    def __get_sql_for_selection_of_pks(cls, model: Type[BaseModel], shape: tuple) -> tuple[str, list[Identifier]]:
+        """Возвращает условие 'WHERE', оставляющее записи, которые вернула бы выборка"""
+        subquery, identifiers = cls.__get_sql_for_selection(model, shape, ('pk',))
+        return f'WHERE {{}}.{{}} IN ({subquery})', get_identifiers(model.db_table, 'id') + identifiers
+
+    @classmethod
+    def __compile_delete_selected(cls, model: Type[BaseModel], shape: tuple) -> Composed:
+        where_part, identifiers_for_where = cls.__get_sql_for_selection_of_pks(model, shape)
+        return get_sql(get_identifiers(model.db_table) + identifiers_for_where, cls.__delete_part, where_part)
+
+    @classmethod
+    def __compile_update_selected(cls, model: Type[BaseModel], shape: tuple) -> Composed:
+        columns, selection_shape = shape
+        set_part, identifiers_for_set = get_sql_for_set_part(columns)
+        where_part, identifiers_for_where = cls.__get_sql_for_selection_of_pks(model, selection_shape)
+        identifiers = get_identifiers(model.db_table) + identifiers_for_set + identifiers_for_where
+        return get_sql(identifiers, cls.__update_part, set_part, where_part)
+
+    @staticmethod
+    def __compile_bulk_create(model: Type[BaseModel], shape: tuple) -> Composed:
+        columns, rows_count = shape
+        identifiers = get_identifiers(model.db_table, *columns, 'id')
+        return get_sql(identifiers, get_sql_for_bulk_creation_method(columns, rows_count))
+
+    @staticmethod
+    def __compile_bulk_update(model: Type[BaseModel], shape: tuple) -> Composed:
+        columns, rows_count = shape
+        s, identifiers = get_data_for_bulk_update_method(model.db_table, columns, rows_count)
+        return get_sql(identifiers, s)
+
+    @classmethod
+    def __compile_save(cls, model: Type[BaseModel], columns: tuple[str, ...]) -> Composed:
+        set_part, identifiers_for_set = get_sql_for_set_part(columns)
+        where_part, identifiers_for_where = get_sql_for_where_part(model, ('pk',))
+        identifiers = [Identifier(model.db_table)] + identifiers_for_set + identifiers_for_where
+        return get_sql(identifiers, cls.__update_part, set_part, where_part)
+
+    @staticmethod
+    def __compile_create(model: Type[BaseModel], columns: tuple[str, ...]) -> Composed:
+        columns_sql, arguments_sql = get_strings_for_sql(len(columns))
+        identifiers = get_identifiers(model.db_table, *columns, 'id')
+        return get_sql_for_creation_method(columns_sql, arguments_sql, identifiers)
+
+    @classmethod
+    def __compile_delete(cls, model: Type[BaseModel], _: tuple[str, ...]) -> Composed:
+        where_part, identifiers_for_where = get_sql_for_where_part(model, ('pk',))
         identifiers = [Identifier(model.db_table)] + identifiers_for_where
-        sql = get_sql(identifiers, cls.__delete_part, where_part)
-        return Request(sql, argument, 'without_output')
+        return get_sql(identifiers, cls.__delete_part, where_part)
 
 
 class TablesManager(Singleton):
@@ -84,10 +268,19 @@ class TablesManager(Singleton):
     Получает данные из 'Database', передает в обработчик и возвращает обработанные данные.
 
     Запросы, не нуждающиеся в коммите, выполняются автоматически.
-    Запрос, нуждающийся в коммите, можно выполнить сразу же, указав 'execution'=True
+    Запрос, нуждающийся в коммите, можно выполнить сразу же, указав 'execution'=True.
+    После исполнения запроса 'create' (и 'bulk_create') созданным объектам присваиваются
+    сгенерированные первичные ключи
     Запросы, не нуждающиеся в коммите, по умолчанию просто добавляются в экземпляр класса 'Database'
     (ВНИМАНИЕ: при автоматическом исполнении какого-либо запроса другие запросы,
     находящиеся в '__unexecuted_requests' экзеспляра класса 'Database', будут исполнены)
+    Методы 'all' и 'filter' возвращают ленивый набор записей 'QuerySet', запрос к БД
+    выполняется только при обращении к его записям.
+    Запрос, возвращающий данные, можно только добавить в очередь, указав 'deferred'=True.
+    Тогда метод 'get' вместо данных возвращает экземпляр класса 'DeferredOutput', а методы 'all' и 'filter' -
+    уже добавленный в очередь 'QuerySet'. Все отложенные запросы выполняются за одно обращение к БД
+    при первом обращении к результату любого из них.
+    Методы 'bulk_create' и 'bulk_update' записывают несколько объектов одним запросом
 
     Работа класса: TablesManager.allowed_method(**kwargs)
 
@@ -97,6 +290,7 @@ class TablesManager(Singleton):
 
     __allowed_methods = ('all', 'filter', 'get', 'save', 'create', 'delete')
     __methods_with_result = ('all', 'filter', 'get')
+    __methods_with_query_set = ('all', 'filter')
     __methods_with_kwargs = ('filter', 'get')
 
     def __init__(self, database: Database) -> None:
@@ -107,12 +301,7 @@ class TablesManager(Singleton):
     def __get_request_result_if_necessary(self) -> Union[None, list[BaseModel]]:
         if not self.__is_method_with_result():
             return
-        result = process_output(self._model, self.__db.output)
-        if self.__method == 'get' and result:
-            if len(result) > 1:
-                raise ValueError("Метод 'get' вернул несколько записей")
-            result = result[0]
-        return result
+        return get_request_result(self._model, self.__method, self.__db.output)
 
     def __check_for_kwargs_dont_exist(self) -> None:
         if self.arguments_for_request:
@@ -124,10 +313,21 @@ class TablesManager(Singleton):
         self.__check_for_kwargs_dont_exist()
         return self.method_to_get_request(self._model)
 
-    def __register_request(self) -> None:
+    def __register_request(self) -> Optional[DeferredOutput]:
         self.method_to_get_request = getattr(RequestFactory, self.__method)
         request = self.__get_request()
-        self.__db.add_unexecuted_request(request)
+        if request is None:
+            return None
+        if self.__is_method_with_result():
+            process = partial(get_request_result, self._model, self.__method)
+            request = request._replace(output=DeferredOutput(self.__db, process))
+        elif self.__method == 'create':
+            request = request._replace(output=DeferredOutput(self.__db, partial(set_generated_pks, [self._model]),
+                                                             eager=True))
+        elif self.__method == 'save':
+            request = request._replace(output=DeferredOutput(self.__db, partial(set_saved_db_state, self._model, None),
+                                                             eager=True))
+        return self.__db.add_unexecuted_request(request)
 
     def __is_method_with_result(self) -> bool:
         return self.__method in self.__methods_with_result
@@ -141,6 +341,13 @@ class TablesManager(Singleton):
         if not isinstance(self.execution, bool):
             raise TypeError('Аругемент execution должен быть булевым значением')
 
+    def __set_deferred_value(self, kwargs: dict[str, Union[int, str]]) -> None:
+        self.deferred = kwargs.pop('deferred', False)
+        if not isinstance(self.deferred, bool):
+            raise TypeError('Аругемент deferred должен быть булевым значением')
+        if self.deferred and not self.__is_method_with_result():
+            raise TypeError(f'Метод {self.__method} не возвращает данные')
+
     def __set_execution_value(self, kwargs: dict[str, Union[int, str]]) -> None:
         if 'execution' in kwargs:
             self.execution = kwargs.pop('execution')
@@ -150,14 +357,48 @@ class TablesManager(Singleton):
 
     def __process_kwargs(self, **kwargs: Union[int, str]) -> None:
         self.__set_execution_value(kwargs)
+        self.__set_deferred_value(kwargs)
         self.arguments_for_request = kwargs
 
-    def __process_method(self, **kwargs: Union[int, str]) -> Union[None, list[BaseModel]]:
+    def __get_query_set(self) -> 'QuerySet':
+        if self.__method not in self.__methods_with_kwargs:
+            self.__check_for_kwargs_dont_exist()
+        query_set = QuerySet(get_model_class(self._model), self.__db).filter(**self.arguments_for_request)
+        if self.deferred:
+            query_set.enqueue()
+        return query_set
+
+    def __process_method(self, **kwargs: Union[int, str]) -> Union[None, BaseModel, 'QuerySet', DeferredOutput]:
         self.__process_kwargs(**kwargs)
-        self.__register_request()
+        if self.__method in self.__methods_with_query_set:
+            return self.__get_query_set()
+        deferred_output = self.__register_request()
+        if self.deferred:
+            return deferred_output
         self.__execute_requests_if_necessary()
         return self.__get_request_result_if_necessary()
 
+    def bulk_create(self, objs: list[BaseModel], execution: bool = False) -> None:
+        """
+        Создает записи для всех объектов 'objs' одним запросом.
+        Сгенерированные первичные ключи присваиваются объектам, когда изменения зафиксированы в БД
+        """
+        if not objs:
+            return
+        request = RequestFactory.bulk_create(get_model_class(self._model), objs)
+        request = request._replace(output=DeferredOutput(self.__db, partial(set_generated_pks, objs), eager=True))
+        add_request_to_db(self.__db, request, execution)
+
+    def bulk_update(self, objs: list[BaseModel], fields: Iterable[str], execution: bool = False) -> None:
+        """Сохраняет поля 'fields' всех объектов 'objs' одним запросом"""
+        if not objs:
+            return
+        fields = tuple(fields)
+        request = RequestFactory.bulk_update(get_model_class(self._model), objs, fields)
+        request = request._replace(output=DeferredOutput(self.__db, partial(set_saved_db_state_of_objs, objs, fields),
+                                                         eager=True))
+        add_request_to_db(self.__db, request, execution)
+
     def __getattr__(self, method: str) -> Callable:
         if method not in self.__allowed_methods:
             raise AttributeError(f'Метод {method} не разрешен')
@@ -165,8 +406,525 @@ class TablesManager(Singleton):
         return self.__process_method
 
 
-def process_output(model, raw_output: list[RawOutputData]):
-    """Обработка сырых данных из БД"""
-    output_dict = get_all_output_like_dict(model, raw_output)
-    result = get_all_output_like_model(model, output_dict)
+class AsyncTablesManager(Singleton):
+    """
+    Асинхронный вариант 'TablesManager' для работы с 'AsyncDatabase' (например, в асинхронном сервере).
+    После создания экземпляра модели работают с БД через него: await Grade.manager.filter(student=student),
+    await grade.manager.save().
+
+    Методы 'all' и 'filter' возвращают 'QuerySet', который выполняется через 'await'.
+    Остальные методы возвращают корутины, запросы исполняются сразу, без очереди
+    (внутри 'async with database.transaction()' - в одной транзакции).
+    Модель, с которой ведется работа ('_model'), запоминается при вызове метода, а не при ожидании корутины,
+    поэтому несколько задач могут работать с менеджером одновременно.
+    Внутри транзакции первичные ключи созданных объектов присваиваются после ее фиксации.
+
+    Синхронные обращения к БД недоступны и вызывают TypeError: 'count', 'exists', 'aggregate'
+    (вместо них - 'acount', 'aexists', 'aaggregate'), 'iterator', 'iter_pages', индексация
+    невыполненного набора целым числом (вместо нее - срез: (await query_set[:1])[0]) и ленивая загрузка
+    отложенных атрибутов. Поэтому поля из 'deferred_fields' моделей выбираются сразу,
+    а поля, исключенные через 'only' или 'defer', нужно загружать явно
+    """
+
+    def __init__(self, database: 'AsyncDatabase') -> None:
+        BaseModel._manager = self
+        self.__db = database
+        self._model: Union[None, BaseModel] = None
+
+    def all(self) -> 'QuerySet':
+        return QuerySet(get_model_class(self._model), self.__db, use_model_deferred_fields=False)
+
+    def filter(self, **kwargs: ModelValuesTypes) -> 'QuerySet':
+        return self.all().filter(**kwargs)
+
+    def get(self, **kwargs: ModelValuesTypes) -> Awaitable[BaseModel]:
+        return self.__get(self._model, kwargs)
+
+    def save(self) -> Awaitable[None]:
+        return self.__save(self._model)
+
+    def create(self) -> Awaitable[None]:
+        return self.__create(self._model)
+
+    def delete(self) -> Awaitable[None]:
+        return self.__db.execute(RequestFactory.delete(self._model))
+
+    def bulk_create(self, objs: list[BaseModel]) -> Awaitable[None]:
+        """Создает записи для всех объектов 'objs' одним запросом"""
+        return self.__bulk_create(get_model_class(self._model), objs)
+
+    def bulk_update(self, objs: list[BaseModel], fields: Iterable[str]) -> Awaitable[None]:
+        """Сохраняет поля 'fields' всех объектов 'objs' одним запросом"""
+        return self.__bulk_update(get_model_class(self._model), objs, tuple(fields))
+
+    async def __get(self, model: BaseModel, kwargs: dict[str, ModelValuesTypes]) -> BaseModel:
+        return get_request_result(model, 'get', await self.__db.fetch(RequestFactory.get(model, **kwargs)))
+
+    async def __save(self, model: BaseModel) -> None:
+        request = RequestFactory.save(model)
+        if request is not None:
+            await self.__db.execute(request._replace(output=DeferredOutput(
+                self.__db, partial(set_saved_db_state, model, None), eager=True)))
+
+    async def __create(self, model: BaseModel) -> None:
+        await self.__db.fetch(RequestFactory.create(model)._replace(output=DeferredOutput(
+            self.__db, partial(set_generated_pks, [model]), eager=True)))
+
+    async def __bulk_create(self, model: Type[BaseModel], objs: list[BaseModel]) -> None:
+        if objs:
+            await self.__db.fetch(RequestFactory.bulk_create(model, objs)._replace(output=DeferredOutput(
+                self.__db, partial(set_generated_pks, objs), eager=True)))
+
+    async def __bulk_update(self, model: Type[BaseModel], objs: list[BaseModel], fields: tuple[str, ...]) -> None:
+        if objs:
+            request = RequestFactory.bulk_update(model, objs, fields)
+            await self.__db.execute(request._replace(output=DeferredOutput(
+                self.__db, partial(set_saved_db_state_of_objs, objs, fields), eager=True)))
+
+
+class QuerySet:
+    """
+    Ленивый набор записей модели.
+
+    Методы 'all', 'filter' и 'exclude' возвращают новый набор, не обращаясь к БД.
+    Запрос выполняется при первом обращении к записям набора (итерация, len, bool, индексация),
+    после чего записи кэшируются в наборе. Метод 'enqueue' добавляет запрос набора
+    в очередь экземпляра класса 'Database', чтобы выполнить его вместе с другими запросами.
+
+    Срез невыполненного набора возвращает новый набор с 'LIMIT'/'OFFSET' в SQL,
+    вместе с 'order_by' это позволяет получить первые N записей, не загружая остальные.
+    Метод 'page_after' реализует постраничную выборку по ключу (keyset pagination),
+    метод 'iterator' - потоковый перебор больших выборок через серверный курсор
+    """
+
+    def __init__(self, model: Type[BaseModel], database: Database,
+                 where: tuple[tuple[bool, dict[str, ModelValuesTypes]], ...] = (),
+                 ordering: tuple[str, ...] = (), limit: Optional[int] = None, offset: int = 0,
+                 fields: tuple[str, ...] = (), output_type: str = 'models', only: tuple[str, ...] = (),
+                 defer: tuple[str, ...] = (), use_model_deferred_fields: bool = True,
+                 related: tuple[str, ...] = (), prefetch: tuple[Prefetch, ...] = (),
+                 annotations: tuple[tuple[str, Aggregate], ...] = ()) -> None:
+        self.model = model
+        self.__db = database
+        self.__where = where
+        self.__ordering = ordering
+        self.__limit = limit
+        self.__offset = offset
+        self.__fields = fields
+        self.__output_type = output_type
+        self.__only = only
+        self.__defer = defer
+        self.__use_model_deferred_fields = use_model_deferred_fields
+        self.__related = related
+        self.__prefetch = prefetch
+        self.__annotations = annotations
+        self.__output: Optional[DeferredOutput] = None
+        self.__result_cache: Optional[list[BaseModel]] = None
+
+    def __clone(self, **changes: Any) -> 'QuerySet':
+        query = {'where': self.__where, 'ordering': self.__ordering, 'limit': self.__limit, 'offset': self.__offset,
+                 'fields': self.__fields, 'output_type': self.__output_type, 'only': self.__only,
+                 'defer': self.__defer, 'use_model_deferred_fields': self.__use_model_deferred_fields,
+                 'related': self.__related, 'prefetch': self.__prefetch, 'annotations': self.__annotations}
+        return QuerySet(self.model, self.__db, **query | changes)
+
+    def __is_sliced(self) -> bool:
+        return self.__limit is not None or self.__offset > 0
+
+    def __add_conditions(self, negated: bool, conditions: dict[str, ModelValuesTypes]) -> 'QuerySet':
+        if not conditions:
+            return self.__clone()
+        if self.__is_sliced():
+            raise TypeError('Нельзя добавить условия выборки после среза')
+        return self.__clone(where=self.__where + ((negated, conditions),))
+
+    def all(self) -> 'QuerySet':
+        return self.__clone()
+
+    def filter(self, **kwargs: ModelValuesTypes) -> 'QuerySet':
+        """
+        Оставляет записи, удовлетворяющие всем условиям. Условия задаются так же, как в 'RequestFactory.filter'.
+        К условию можно добавить оператор: 'gt', 'lt', 'gte', 'lte', 'in' (коллекция значений),
+        'range' (пара границ), 'isnull', 'icontains'. Например: filter(pk__in=[1, 2], date__range=(start, finish))
+        """
+        return self.__add_conditions(False, kwargs)
+
+    def exclude(self, **kwargs: ModelValuesTypes) -> 'QuerySet':
+        """Исключает записи, удовлетворяющие всем условиям одновременно"""
+        return self.__add_conditions(True, kwargs)
+
+    def order_by(self, *fields: str) -> 'QuerySet':
+        """
+        Сортирует записи в БД ('ORDER BY') по полям 'fields', заменяя прежнюю сортировку.
+        Поле с префиксом '-' сортируется по убыванию. Поля связанной модели указываются
+        с префиксом так же, как в условиях выборки. Например: order_by('student__second_name', '-date')
+        """
+        if self.__is_sliced():
+            raise TypeError('Нельзя изменить сортировку после среза')
+        if self.__annotations:
+            check_ordering_for_grouping(fields, self.__fields)
+        return self.__clone(ordering=fields)
+
+    def select_related(self, *paths: str) -> 'QuerySet':
+        """
+        Создает вместе с записями модели, связанные через несколько внешних ключей, одним запросом с 'JOIN'.
+        Путь задается так же, как поле в условиях выборки: select_related('student__school_class__classroom_teacher').
+        Непосредственно связанные модели создаются всегда
+        """
+        for path in paths:
+            resolve_field(self.model, path + '__pk')
+        return self.__clone(related=self.__related + paths)
+
+    def prefetch_related(self, *relations: Union[str, Prefetch]) -> 'QuerySet':
+        """
+        Загружает обратные связи (например, 'student_set' у классов, 'grade_set' у учеников) для всех записей набора:
+        по одному запросу 'WHERE <внешний ключ> IN (...)' на связь. Чтобы отобрать или отсортировать связанные
+        записи, связь передается как Prefetch('grade_set', Grade.manager.filter(subject=subject))
+        """
+        prefetch = tuple(relation if isinstance(relation, Prefetch) else Prefetch(relation) for relation in relations)
+        for relation in prefetch:
+            if relation.relation not in self.model.reverse_related_data:
+                raise ValueError(f'У модели {self.model.__name__} нет обратной связи {relation.relation}')
+        return self.__clone(prefetch=self.__prefetch + prefetch)
+
+    def only(self, *fields: str) -> 'QuerySet':
+        """
+        Выбирает из БД только поля 'fields' (и pk), остальные поля загружаются из БД при первом обращении.
+        Поля связанной модели указываются с префиксом: only('value', 'student__second_name')
+        """
+        return self.__clone(only=fields)
+
+    def defer(self, *fields: Optional[str]) -> 'QuerySet':
+        """
+        Не выбирает из БД поля 'fields', они загружаются при первом обращении.
+        defer(None) отменяет отложенную загрузку, в том числе полей из 'deferred_fields' моделей
+        """
+        if fields == (None,):
+            return self.__clone(only=(), defer=(), use_model_deferred_fields=False)
+        return self.__clone(defer=self.__defer + fields)
+
+    def values(self, *fields: str) -> 'QuerySet':
+        """
+        Возвращает набор словарей {поле: значение} вместо моделей. Из БД выбираются только
+        поля 'fields' (по умолчанию - все поля модели), связанные таблицы присоединяются,
+        только если нужны. Поле связанной модели указывается с префиксом: values('pk', 'subject__name')
+        """
+        return self.__clone(fields=tuple(fields or self.model.attributes), output_type='values')
+
+    def values_list(self, *fields: str, flat: bool = False) -> 'QuerySet':
+        """То же, что 'values', но возвращает кортежи. При 'flat'=True (одно поле) - сами значения"""
+        if flat and len(fields) != 1:
+            raise TypeError("Аргумент 'flat' можно указать только для одного поля")
+        return self.__clone(fields=tuple(fields or self.model.attributes), output_type='flat' if flat else 'values_list')
+
+    def annotate(self, *aggregates: Aggregate, **named_aggregates: Aggregate) -> 'QuerySet':
+        """
+        Добавляет к записям 'values'/'values_list' значения агрегатных функций, вычисленные в БД
+        для каждой группы записей с одинаковыми значениями выбранных полей ('GROUP BY').
+        Например, средняя оценка ученика по каждому предмету:
+        Grade.manager.filter(student=student).values('subject__name').annotate(average=Avg('value'))
+        Сортировать записи можно только по выбранным полям
+        """
+        if self.__output_type not in ('values', 'values_list'):
+            raise TypeError("Метод 'annotate' применяется только после 'values' или 'values_list'")
+        check_ordering_for_grouping(self.__ordering, self.__fields)
+        annotations = tuple(get_named_aggregates(aggregates, named_aggregates).items())
+        return self.__clone(annotations=self.__annotations + annotations)
+
+    def aggregate(self, *aggregates: Aggregate, **named_aggregates: Aggregate) -> dict[str, ValuesTypesFromDB]:
+        """
+        Вычисляет в БД агрегатные функции по всем записям набора и возвращает словарь {имя: значение}.
+        Имя агрегата без имени - '<поле>__<функция>'. Например: aggregate(Avg('value')) -> {'value__avg': 4.5}
+        """
+        return self.__db.add_unexecuted_request(self.__get_aggregate_request(aggregates, named_aggregates)).result
+
+    async def aaggregate(self, *aggregates: Aggregate, **named_aggregates: Aggregate) -> dict[str, ValuesTypesFromDB]:
+        """Вариант 'aggregate' для 'AsyncDatabase': await query_set.aaggregate(Avg('value'))"""
+        request = self.__get_aggregate_request(aggregates, named_aggregates)
+        await self.__db.fetch(request)
+        return request.output.result
+
+    def __get_aggregate_request(self, aggregates: tuple[Aggregate, ...],
+                                named_aggregates: dict[str, Aggregate]) -> Request:
+        if self.__is_sliced():
+            raise TypeError('Нельзя вычислить агрегатные функции после среза')
+        named_aggregates = get_named_aggregates(aggregates, named_aggregates)
+        request = RequestFactory.select(self.model, self.__where, aggregates=tuple(named_aggregates.values()))
+        return request._replace(output=DeferredOutput(self.__db, partial(process_aggregated_output,
+                                                                         tuple(named_aggregates))))
+
+    def count(self) -> int:
+        """Количество записей набора. Записи не загружаются из БД, если набор еще не выполнен"""
+        if self.__result_cache is not None:
+            return len(self.__result_cache)
+        if self.__is_sliced():
+            return len(self.values_list('pk', flat=True))
+        return self.aggregate(count=Count())['count']
+
+    def exists(self) -> bool:
+        """Есть ли в наборе хотя бы одна запись. Из БД выбирается не больше одного pk"""
+        if self.__result_cache is not None:
+            return bool(self.__result_cache)
+        return bool(self.values_list('pk', flat=True)[:1])
+
+    async def acount(self) -> int:
+        """Вариант 'count' для 'AsyncDatabase'"""
+        if self.__result_cache is not None:
+            return len(self.__result_cache)
+        if self.__is_sliced():
+            return len(await self.values_list('pk', flat=True))
+        return (await self.aaggregate(count=Count()))['count']
+
+    async def aexists(self) -> bool:
+        """Вариант 'exists' для 'AsyncDatabase'"""
+        if self.__result_cache is not None:
+            return bool(self.__result_cache)
+        return bool(await self.values_list('pk', flat=True)[:1])
+
+    def page_after(self, key_value: Optional[ModelValuesTypes], page_size: int, key: str = 'pk') -> 'QuerySet':
+        """
+        Возвращает 'page_size' записей, следующих в порядке возрастания ключа 'key'
+        за записью со значением ключа 'key_value' (None - первая страница).
+        В отличие от 'OFFSET', БД не перебирает записи предыдущих страниц. Ключ должен быть уникальным
+        """
+        query_set = self if key_value is None else self.filter(**{f'{key}__gt': key_value})
+        return query_set.__clone(ordering=(key,))[:page_size]
+
+    def iter_pages(self, page_size: int, key: str = 'pk') -> Iterator[list[BaseModel]]:
+        """Постранично перебирает записи набора в порядке возрастания ключа 'key'"""
+        key_value = None
+        while True:
+            page = list(self.page_after(key_value, page_size, key))
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            key_value = getattr(page[-1], key)
+
+    def __get_fields_to_select(self) -> tuple[str, ...]:
+        if self.__output_type != 'models':
+            return self.__fields
+        return get_fields_to_load(self.model, self.__only, self.__defer, self.__use_model_deferred_fields,
+                                  self.__related)
+
+    def get_request(self) -> Request:
+        return RequestFactory.select(self.model, self.__where, self.__ordering, self.__limit, self.__offset,
+                                     self.__get_fields_to_select(),
+                                     tuple(aggregate for _, aggregate in self.__annotations))
+
+    def __get_output_processor(self, in_session: bool = True) -> Callable[[list[RawOutputData]], list]:
+        """
+        Обработчик вывода набора. Модели создаются через карту сессии, если 'in_session' не False,
+        иначе - через отдельную карту для каждого вывода
+        """
+        if self.__output_type == 'models':
+            return partial(process_output, self.model, fields=self.__get_fields_to_select(),
+                           identity_map=get_session_identity_map() if in_session else None)
+        names = self.__fields + tuple(name for name, _ in self.__annotations)
+        return partial(process_projected_output, names, self.__output_type)
+
+    def iterator(self, chunk_size: int = 2000) -> Iterator[BaseModel]:
+        """
+        Перебирает записи набора, получая их из БД частями по 'chunk_size' строк через серверный курсор.
+        Записи не кэшируются ни в наборе, ни в карте сессии, поэтому память не растет с размером выборки
+        """
+        if self.__result_cache is not None:
+            yield from self.__result_cache
+            return
+        process = self.__get_output_processor(in_session=False)
+        for rows in self.__db.iterate_request(self.get_request(), chunk_size):
+            yield from self.__prefetch_related_objects(process(rows))
+
+    def delete(self, execution: bool = False) -> None:
+        """Удаляет все записи набора одним запросом"""
+        request = RequestFactory.delete_selected(self.model, self.__where, self.__ordering, self.__limit, self.__offset)
+        add_request_to_db(self.__db, request, execution)
+        self.__result_cache = None
+
+    def update(self, execution: bool = False, **values: ModelValuesTypes) -> None:
+        """
+        Присваивает полям значения 'values' у всех записей набора одним запросом.
+        Записанные значения этих полей у загруженных ранее объектов модели становятся неизвестными,
+        поэтому их 'save' записывает эти поля
+        """
+        request = RequestFactory.update_selected(self.model, values, self.__where, self.__ordering,
+                                                 self.__limit, self.__offset)
+        request = request._replace(output=DeferredOutput(self.__db, partial(register_update_in_bulk, self.model,
+                                                                            tuple(values)), eager=True))
+        add_request_to_db(self.__db, request, execution)
+        self.__result_cache = None
+
+    def enqueue(self) -> 'QuerySet':
+        """Добавляет запрос набора в очередь запросов, не выполняя его"""
+        if self.__output is None and self.__result_cache is None:
+            request = self.get_request()
+            request = request._replace(output=DeferredOutput(self.__db, self.__get_output_processor()))
+            self.__output = self.__db.add_unexecuted_request(request)
+        return self
+
+    def __fetch_all(self) -> list[BaseModel]:
+        if self.__result_cache is None:
+            self.__result_cache = self.__prefetch_related_objects(self.enqueue().__output.result)
+            self.__output = None
+        return self.__result_cache
+
+    def __prefetch_related_objects(self, objs: list[BaseModel]) -> list[BaseModel]:
+        if self.__output_type == 'models' and objs:
+            for prefetch in self.__prefetch:
+                prefetch_related_objects(self.__db, objs, prefetch)
+        return objs
+
+    def __get_slice(self, index: slice) -> 'QuerySet':
+        """Возвращает новый набор, ограниченный срезом в SQL ('LIMIT'/'OFFSET')"""
+        start, stop = index.start or 0, index.stop
+        if index.step not in (None, 1) or start < 0 or stop is not None and stop < 0:
+            raise ValueError('Поддерживаются только срезы с неотрицательными границами и без шага')
+        limit = None if stop is None else max(stop - start, 0)
+        if self.__limit is not None:
+            remaining = max(self.__limit - start, 0)
+            limit = remaining if limit is None else min(limit, remaining)
+        return self.__clone(limit=limit, offset=self.__offset + start)
+
+    def __iter__(self) -> Iterator[BaseModel]:
+        return iter(self.__fetch_all())
+
+    def __len__(self) -> int:
+        return len(self.__fetch_all())
+
+    def __bool__(self) -> bool:
+        return bool(self.__fetch_all())
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[BaseModel, 'QuerySet', list[BaseModel]]:
+        if self.__result_cache is not None:
+            return self.__result_cache[index]
+        if isinstance(index, slice):
+            return self.__get_slice(index)
+        if index < 0:
+            raise ValueError('Отрицательные индексы не поддерживаются')
+        result = list(self.__get_slice(slice(index, index + 1)))
+        if not result:
+            raise IndexError('Индекс вне набора записей')
+        return result[0]
+
+    def __await__(self) -> Generator[Any, None, list[BaseModel]]:
+        """Выполняет набор через 'AsyncDatabase': grades = await Grade.manager.filter(student=student)"""
+        return self.__fetch_all_async().__await__()
+
+    async def __fetch_all_async(self) -> list[BaseModel]:
+        if self.__result_cache is None:
+            objs = self.__get_output_processor()(await self.__db.fetch(self.get_request()))
+            if self.__output_type == 'models' and objs:
+                for prefetch in self.__prefetch:
+                    relation, query_set = get_query_set_for_prefetch(self.__db, objs, prefetch)
+                    attach_prefetched_objects(objs, relation, await query_set)
+            self.__result_cache = objs
+        return self.__result_cache
+
+    def __repr__(self) -> str:
+        return f'<QuerySet {self.__fetch_all()!r}>'
+
+
+def prefetch_related_objects(database: Database, objs: list[BaseModel], prefetch: Prefetch) -> None:
+    """
+    Загружает одним запросом записи обратной связи для всех 'objs' и прикрепляет их к объектам.
+    Атрибуту внешнего ключа связанной записи присваивается сам объект из 'objs'
+    """
+    relation, query_set = get_query_set_for_prefetch(database, objs, prefetch)
+    attach_prefetched_objects(objs, relation, query_set)
+
+
+def get_query_set_for_prefetch(database: Database, objs: list[BaseModel],
+                               prefetch: Prefetch) -> tuple[ReverseRelation, 'QuerySet']:
+    """Возвращает обратную связь и набор записей этой связи для всех 'objs'"""
+    relation = objs[0].reverse_related_data[prefetch.relation]
+    query_set = prefetch.query_set if prefetch.query_set is not None else QuerySet(relation.model, database)
+    return relation, query_set.filter(**{f'{relation.attr}__in': objs})
+
+
+def attach_prefetched_objects(objs: list[BaseModel], relation: ReverseRelation,
+                              related_objs_to_attach: Iterable[BaseModel]) -> None:
+    related_objs = defaultdict(list)
+    for related_obj in related_objs_to_attach:
+        related_objs[get_pk_related_entry(getattr(related_obj, relation.attr))].append(related_obj)
+    for obj in objs:
+        for related_obj in related_objs[obj.pk]:
+            setattr(related_obj, relation.attr, obj)
+        relation.set_prefetched(obj, related_objs[obj.pk])
+
+
+def add_request_to_db(database: Database, request: Request, execution: bool) -> None:
+    """Добавляет запрос, изменяющий данные, в очередь. Если 'execution'=True, очередь сразу исполняется"""
+    if not isinstance(execution, bool):
+        raise TypeError('Аругемент execution должен быть булевым значением')
+    database.add_unexecuted_request(request)
+    if execution:
+        database.execute_requests()
+
+
+def check_ordering_for_grouping(ordering: tuple[str, ...], fields: tuple[str, ...]) -> None:
+    """Проверяет, что записи сгруппированного набора сортируются только по полям группировки"""
+    for field in ordering:
+        if field.removeprefix('-') not in fields:
+            raise ValueError(f'Нельзя сортировать сгруппированные записи по полю {field}, '
+                             f'не входящему в группировку')
+
+
+def set_saved_db_state_of_objs(objs: list[BaseModel], attrs: tuple[str, ...],
+                               raw_output: list[RawOutputData]) -> list[BaseModel]:
+    for obj in objs:
+        set_saved_db_state(obj, attrs, raw_output)
+    return objs
+
+
+def set_generated_pks(objs: list[BaseModel], raw_output: list[RawOutputData]) -> list[BaseModel]:
+    """Присваивает объектам первичные ключи, которые вернул запрос ('RETURNING id')"""
+    for obj, (pk,) in zip(objs, raw_output):
+        obj.pk = pk
+        remember_db_state(obj)
+    return objs
+
+
+def get_request_result(model: BaseModel, method: str,
+                       raw_output: list[RawOutputData]) -> Union[list[BaseModel], BaseModel]:
+    """Обработка вывода запроса с учетом метода, которым он был получен"""
+    result = process_output(model, raw_output, identity_map=get_session_identity_map())
+    if method == 'get' and result:
+        if len(result) > 1:
+            raise ValueError("Метод 'get' вернул несколько записей")
+        result = result[0]
     return result
+
+
+def process_projected_output(fields: tuple[str, ...], output_type: str,
+                             raw_output: list[RawOutputData]) -> list[Union[dict, tuple, ValuesTypesFromDB]]:
+    """Обработка вывода запроса, выбирающего отдельные поля ('values', 'values_list')"""
+    if output_type == 'values':
+        return [dict(zip(fields, row)) for row in raw_output]
+    if output_type == 'flat':
+        return [row[0] for row in raw_output]
+    return raw_output
+
+
+def get_named_aggregates(aggregates: tuple[Aggregate, ...],
+                         named_aggregates: dict[str, Aggregate]) -> dict[str, Aggregate]:
+    """Объединяет агрегаты без имени (им дается имя по умолчанию) и именованные агрегаты"""
+    return {aggregate.default_alias: aggregate for aggregate in aggregates} | named_aggregates
+
+
+def process_aggregated_output(names: tuple[str, ...], raw_output: list[RawOutputData]) -> dict[str, ValuesTypesFromDB]:
+    """Обработка вывода запроса, вычисляющего агрегатные функции по всем записям (одна строка)"""
+    return dict(zip(names, raw_output[0]))
+
+
+def process_output(model, raw_output: list[RawOutputData], fields: tuple[str, ...] = (),
+                   identity_map: Optional[IdentityMap] = None):
+    """
+    Обработка сырых данных из БД. Данные из БД не валидируются повторно.
+    'fields' - поля, выбранные запросом (по умолчанию - как в 'RequestFactory.select').
+    Одной записи соответствует один объект: в пределах вывода или, если передана
+    'identity_map' (карта сессии), в пределах сессии
+    """
+    model = get_model_class(model)
+    layout = get_rows_layout(model, fields or get_fields_to_load(model))
+    identity_map = IdentityMap() if identity_map is None else identity_map
+    return [get_model_from_db_row(model, row, layout, identity_map) for row in raw_output]
@@ -12,7 +12,9 @@ from working_with_models.models import Period, Administrator
 
 
 def main():
-    db = Database(DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST, DATABASE_PORT)
+    db = Database(DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST, DATABASE_PORT,
+                  DATABASE_MIN_POOL_SIZE, DATABASE_MAX_POOL_SIZE, DATABASE_POOL_IDLE_TIMEOUT,
+                  DATABASE_PREPARE_THRESHOLD)
     State.db = db
     TablesManager(db)
     set_current_dates_to_state(Period.manager.get(is_current=True))
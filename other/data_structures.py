@@ -1,4 +1,4 @@
-from typing import NamedTuple, Literal
+from typing import NamedTuple, Literal, Optional, Callable, Any
 
 from psycopg2.sql import Composed
 
@@ -7,3 +7,121 @@ class Request(NamedTuple):
     sql: Composed
     args: list[int, str]
     type: Literal['with_output', 'without_output']
+    output: Optional['DeferredOutput'] = None
+
+
+class Prefetch(NamedTuple):
+    """
+    Обратная связь 'relation' (например, 'student_set'), которую загружает 'QuerySet.prefetch_related'.
+    'query_set' - набор записей связанной модели, из которого они выбираются (с условиями, сортировкой и т.д.)
+    """
+    relation: str
+    query_set: Optional[Any] = None
+
+
+class DeferredOutput:
+    """
+    Вывод запроса, находящегося в очереди запросов экземпляра класса 'Database'.
+    Заполняется при исполнении очереди, поэтому несколько запросов на чтение можно
+    выполнить за одно обращение к БД. Если результат запрашивается до исполнения очереди,
+    очередь исполняется автоматически.
+
+    process - обработчик сырых данных из БД, результат которого возвращает атрибут 'result'
+    eager - обработать вывод сразу после фиксации изменений запроса в БД (метод 'confirm'),
+    например, чтобы присвоить созданным объектам сгенерированные первичные ключи.
+    При откате транзакции вывод не обрабатывается, и объекты не считаются записанными в БД
+    """
+
+    def __init__(self, database: 'Database', process: Callable[[list[tuple]], Any] = lambda output: output,
+                 eager: bool = False) -> None:
+        self.__database = database
+        self.__process = process
+        self.__eager = eager
+        self.__done = False
+        self.__output = None
+        self.__result = None
+
+    @property
+    def done(self) -> bool:
+        return self.__done
+
+    def set_output(self, output: list[tuple]) -> None:
+        self.__output = output
+        self.__done = True
+
+    def confirm(self) -> None:
+        """Вызывается, когда изменения запроса зафиксированы в БД"""
+        if self.__eager:
+            self.result
+
+    @property
+    def result(self) -> Any:
+        """Обработанный вывод запроса. Сырые данные обрабатываются один раз, при первом обращении"""
+        if not self.__done:
+            self.__database.execute_requests()
+        if self.__output is not None:
+            self.__result = self.__process(self.__output)
+            self.__output = None
+        return self.__result
+
+
+class IdentityMap:
+    """
+    Карта соответствия (класс модели, pk) -> объект модели. Каждой записи БД соответствует
+    ровно один объект, поэтому модели, на которые ссылается много записей (например, ученик в оценках),
+    создаются один раз, а проверка 'grade.student in students' сравнивает ссылки
+    """
+
+    def __init__(self) -> None:
+        self.__objs: dict[tuple[type, Any], Any] = {}
+
+    def get(self, model: type, pk: Any) -> Optional[Any]:
+        return self.__objs.get((model, pk))
+
+    def add(self, obj: Any) -> None:
+        if obj.pk is not None:
+            self.__objs[(type(obj), obj.pk)] = obj
+
+    def clear(self) -> None:
+        self.__objs.clear()
+
+    def __len__(self) -> int:
+        return len(self.__objs)
+
+
+class StatementUsage:
+    """
+    Учет исполнений запроса экземпляром класса 'Database'.
+    'count' - сколько раз запрос исполнен, 'name' - имя, под которым он подготавливается на сервере
+    """
+
+    __slots__ = ('sql', 'count', 'name')
+
+    def __init__(self, sql: Composed) -> None:
+        self.sql = sql
+        self.count = 0
+        self.name: Optional[str] = None
+
+
+class PoolStatistics(NamedTuple):
+    """
+    Статистика пула соединений.
+    'checkouts' - сколько раз соединение выдавалось из пула, 'waits' - сколько раз
+    пришлось ждать освобождения соединения, 'connects' - сколько соединений было открыто,
+    'discards' - сколько соединений было закрыто (неисправные или простаивающие слишком долго)
+    """
+
+    checkouts: int
+    waits: int
+    connects: int
+    discards: int
+    size: int
+    idle: int
+
+
+class SeqScanReport(NamedTuple):
+    """Последовательное сканирование большой таблицы в плане запроса"""
+    table: str
+    table_rows: int
+    filter: Optional[str]
+    sql: str
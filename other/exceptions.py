@@ -51,3 +51,10 @@ class SemanticCommandError(Exception):
 
 class ExitGradingCommand(Exception):
     """Исключение, возникающие при желании пользователя выйти из системы оценивания"""
+
+
+class ConnectionPoolExhausted(Exception):
+    """Исключение, возникающие при отсутствии свободных соединений в пуле по истечении времени ожидания"""
+
+    def __str__(self) -> str:
+        return 'Нет свободных соединений с базой данных'
@@ -1,19 +1,25 @@
 import datetime
+import re
 from hashlib import sha3_256
-from typing import Union, Generator, Iterable
+from itertools import count
+from typing import Union, Iterable, Iterator, Optional
 
-from psycopg2.sql import Identifier, Composed, SQL
+from psycopg2.sql import Identifier, Composed, SQL, Composable
 
 from config import STATIC_SALT
 from other.exceptions import ManyInstanceOfClassError
 
 alphabet_ru = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
 
+lookups = {'exact': '{}.{} = %s', 'gt': '{}.{} > %s', 'lt': '{}.{} < %s', 'gte': '{}.{} >= %s', 'lte': '{}.{} <= %s',
+           'in': '{}.{} = ANY(%s)', 'range': '{}.{} BETWEEN %s AND %s', 'isnull': '{}.{} IS NULL',
+           'notnull': '{}.{} IS NOT NULL', 'icontains': '{}.{} ILIKE %s'}
+
 ModelValuesTypes = Union[int, str, datetime.date, 'BaseModel', bool]
 ValuesTypesFromDB = Union[int, str, datetime.date, bool]
 RawOutputData = tuple[ValuesTypesFromDB, ...]
-RawDictOutputData = dict[str, ValuesTypesFromDB]
-DictOutputData = dict[str, Union[ValuesTypesFromDB, 'DictOutputData']]
+
+not_loaded = object()
 
 
 class Singleton:
@@ -55,6 +61,95 @@ def get_data_to_write_to_db(model: 'BaseModel') -> tuple[list[str], list[Union[i
     return columns, arguments
 
 
+def get_changed_data_to_write_to_db(model: 'BaseModel') -> tuple[list[str], list[Union[int, str]]]:
+    """
+    Возвращает подготовленные для записи в БД данные только тех атрибутов, которые изменились
+    с момента загрузки модели из БД (или последней записи в БД). Для модели, состояние которой
+    в БД неизвестно, возвращаются данные всех атрибутов
+    """
+    db_state = get_db_state(model)
+    columns, arguments = [], []
+    for attr, value in model:
+        if attr == 'pk':
+            continue
+        column, value = process_attr_and_value(attr, value, model)
+        if attr not in db_state or db_state[attr] != value:
+            columns.append(column)
+            arguments.append(value)
+    return columns, arguments
+
+
+def set_db_state(model: 'BaseModel', values: tuple) -> None:
+    """
+    Запоминает значения атрибутов, записанные в БД: кортеж значений в порядке 'storage_names' модели,
+    на месте незагруженного атрибута - 'not_loaded'. Имена атрибутов не хранятся в каждом объекте
+    """
+    object.__setattr__(model, '_db_state', values)
+    object.__setattr__(model, '_db_state_version', model.bulk_updates_count)
+
+
+def get_db_state_values(model: 'BaseModel') -> Optional[tuple]:
+    """
+    Возвращает значения атрибутов, записанные в БД, в порядке 'storage_names' (None, если они неизвестны).
+    Атрибуты, измененные в БД методом 'QuerySet.update' после запоминания значений, считаются незагруженными
+    """
+    try:
+        values = object.__getattribute__(model, '_db_state')
+        version = object.__getattribute__(model, '_db_state_version')
+    except AttributeError:
+        return None
+    if version == model.bulk_updates_count:
+        return values
+    return tuple(not_loaded if model.attributes_updated_in_bulk.get(attr, 0) > version else value
+                 for attr, value in zip(model.attributes, values))
+
+
+def update_db_state(model: 'BaseModel', storage_names: Iterable[str], values: Iterable[ValuesTypesFromDB]) -> None:
+    """Обновляет записанные в БД значения атрибутов 'storage_names', остальные записанные значения сохраняются"""
+    saved_values = get_db_state_values(model)
+    db_state = [not_loaded] * len(model.storage_names) if saved_values is None else list(saved_values)
+    for storage_name, value in zip(storage_names, values):
+        db_state[model.storage_names.index(storage_name)] = value
+    set_db_state(model, tuple(db_state))
+
+
+def get_db_state(model: 'BaseModel') -> dict[str, ValuesTypesFromDB]:
+    """Возвращает значения атрибутов, записанные в БД, по именам атрибутов. Пустой словарь, если они неизвестны"""
+    values = get_db_state_values(model) or ()
+    return {attr: value for attr, value in zip(model.attributes, values) if value is not not_loaded}
+
+
+def remember_db_state(model: 'BaseModel', attrs: Optional[Iterable[str]] = None) -> None:
+    """
+    Запоминает текущие значения атрибутов модели как записанные в БД.
+    Если указаны 'attrs', то только значения этих атрибутов, остальные записанные значения сохраняются
+    """
+    if attrs is None:
+        set_db_state(model, (not_loaded,) * len(model.storage_names))
+    storage_names, values = [], []
+    for attr, value in model:
+        if attrs is None or attr in attrs:
+            storage_names.append(model.storage_names[model.attributes.index(attr)])
+            values.append(process_attr_and_value(attr, value, model)[1])
+    update_db_state(model, storage_names, values)
+
+
+def set_saved_db_state(model: 'BaseModel', attrs: Optional[Iterable[str]], _: list[RawOutputData]) -> 'BaseModel':
+    """Обработчик вывода запроса записи: после его исполнения запоминает записанные значения"""
+    remember_db_state(model, attrs)
+    return model
+
+
+def register_update_in_bulk(model: type, attrs: Iterable[str], _: list[RawOutputData]) -> None:
+    """
+    Обработчик вывода запроса 'QuerySet.update': после его исполнения записанные значения атрибутов 'attrs'
+    у загруженных ранее объектов модели считаются неактуальными
+    """
+    model.bulk_updates_count += 1
+    for attr in attrs:
+        model.attributes_updated_in_bulk[attr] = model.bulk_updates_count
+
+
 def add_data_to_lists(attr: str, value: ModelValuesTypes,
                       arguments: list, columns: list, model: 'BaseModel') -> None:
     """Добавляет данные в списки аргументов и столбцов для создания запроса к БД"""
@@ -63,9 +158,13 @@ def add_data_to_lists(attr: str, value: ModelValuesTypes,
     columns.append(attr)
 
 
+def is_related_attr(attr: str, model: 'BaseModel') -> bool:
+    return attr in model.related_data or any(attr in r_model.related_data for r_model in model.related_data.values())
+
+
 def process_attr_and_value(attr: str, value: ModelValuesTypes,
                            model: 'BaseModel') -> tuple[str, Union[int, str]]:
-    if attr in model.related_data or any(attr in r_model.related_data for r_model in model.related_data.values()):
+    if is_related_attr(attr, model):
         value = get_pk_related_entry(value)
         attr = attr + '_id'
     return attr, value
@@ -82,112 +181,457 @@ def get_identifiers(*args: str) -> list[Identifier]:
 
 def get_sql_for_creation_method(columns_sql: str, arguments_sql: str,
                                 identifiers: list[Identifier]) -> Composed:
-    s = 'INSERT INTO {} ' + f'({columns_sql})' + f' VALUES ({arguments_sql})'
+    s = 'INSERT INTO {} ' + f'({columns_sql})' + f' VALUES ({arguments_sql})' + ' RETURNING {}'
     return get_sql(identifiers, s)
 
 
-def get_data_for_join_part_of_sql(model: 'BaseModel') -> tuple[str, list[Identifier]]:
+def get_data_for_join_part_of_sql(model: 'BaseModel',
+                                  related_paths: Optional[Iterable[str]] = None) -> tuple[str, list[Identifier]]:
+    """
+    Присоединяет таблицы связанных моделей. Если указаны 'related_paths', то только таблицы по этим путям
+    (например, 'student' и 'student__school_class'). Таблица непосредственно связанной модели
+    присоединяется под своим именем, таблица более глубокой модели - под псевдонимом, равным пути к ней,
+    поэтому одна таблица может быть присоединена несколько раз
+    """
     s, identifiers_for_join = [], []
     for attr in model.related_data:
+        if related_paths is not None and attr not in related_paths:
+            continue
         s.append('JOIN {} ON {}.{} = {}.{}')
         related_table_name = model.related_data[attr].db_table
         identifiers_for_join += get_identifiers(related_table_name, model.db_table,
                                                 attr + '_id', related_table_name, 'id')
+    deep_paths = sorted((path for path in related_paths or () if '__' in path), key=lambda p: (p.count('__'), p))
+    for path in deep_paths:
+        parent_path, _, attr = path.rpartition('__')
+        s.append('JOIN {} AS {} ON {}.{} = {}.{}')
+        identifiers_for_join += get_identifiers(get_model_for_path(model, path).db_table, path,
+                                                get_alias_for_path(model, parent_path), attr + '_id', path, 'id')
     return ' '.join(s), identifiers_for_join
 
 
-def get_sql(identifiers: list[Identifier], *args: str) -> Composed:
-    return SQL(' '.join(args)).format(*identifiers)
+def get_model_for_path(model: 'BaseModel', path: str) -> type:
+    """Возвращает класс связанной модели по пути к ней (например, 'student__school_class' -> Class)"""
+    for attr in path.split('__'):
+        model = model.related_data[attr]
+    return model
+
 
+def get_alias_for_path(model: 'BaseModel', path: str) -> str:
+    """Возвращает имя, под которым в запросе присоединена таблица модели по пути 'path' ('' - главная модель)"""
+    if not path:
+        return model.db_table
+    if '__' not in path:
+        return model.related_data[path].db_table
+    return path
 
-def get_all_output_like_dict(model: 'BaseModel',
-                             output: list[RawOutputData]) -> list[DictOutputData]:
-    return [process_raw_line_of_output(raw_line, model) for raw_line in output]
 
+def resolve_field(model: 'BaseModel', field: str) -> tuple[str, 'BaseModel', str]:
+    """
+    Возвращает имя присоединенной таблицы, модель и атрибут, к которым относится поле
+    (например, 'student__school_class__number' -> ('student__school_class', Class, 'number'))
+    """
+    path = []
+    owner = model
+    *prefixes, attr = field.split('__')
+    for prefix in prefixes:
+        if prefix not in owner.related_data:
+            raise ValueError(f'Модель {owner.__name__ if isinstance(owner, type) else type(owner).__name__} '
+                             f'не связана с моделью по атрибуту {prefix}')
+        owner = owner.related_data[prefix]
+        path.append(prefix)
+    return get_alias_for_path(model, '__'.join(path)), owner, attr
 
-def process_raw_line_of_output(line: tuple[ValuesTypesFromDB, ...], model: 'BaseModel') -> DictOutputData:
-    get_value = get_value_from_collection(line)
-    dict_line = get_raw_line_like_dict(get_value, model)
-    replace_pk_with_dict(dict_line, get_value, model)
-    return dict_line
 
+def get_related_paths_for_field(model: 'BaseModel', field: str) -> list[str]:
+    """Возвращает пути ко всем связанным моделям, через которые проходит поле"""
+    *prefixes, _ = field.split('__')
+    return ['__'.join(prefixes[:depth]) for depth in range(1, len(prefixes) + 1)]
 
-def get_raw_line_like_dict(value: Generator[ValuesTypesFromDB, None, None],
-                           model: 'BaseModel') -> RawDictOutputData:
-    return {attr: next(value) for attr in model.attributes}
 
+def get_sql(identifiers: list[Identifier], *args: str) -> Composed:
+    return SQL(' '.join(arg for arg in args if arg)).format(*identifiers)
 
-def get_value_from_collection(collection: Iterable) \
-        -> Generator[Union[int, str, datetime.date], None, None]:
-    for value in collection:
-        yield value
 
+def get_attributes_to_load(model: type, prefix: Optional[str], only: tuple[str, ...],
+                           defer: tuple[str, ...], use_model_deferred_fields: bool) -> list[str]:
+    """Возвращает атрибуты модели (главной, если 'prefix' None, или связанной), которые выбираются из БД"""
+    def get_attrs_of_model(fields: tuple[str, ...]) -> set[str]:
+        if prefix is None:
+            return {field for field in fields if '__' not in field}
+        return {field.removeprefix(f'{prefix}__') for field in fields
+                if field.startswith(f'{prefix}__') and '__' not in field.removeprefix(f'{prefix}__')}
 
-def replace_pk_with_dict(dict_line: RawDictOutputData,
-                         get_value: Generator[ValuesTypesFromDB, None, None],
-                         model: 'BaseModel') -> None:
-    """Заменяет первичные ключи связанных моделей в словаре dict_line, на словари с данными"""
-    for related_model, related_model_class in model.related_data.items():
-        dict_line[related_model] = get_raw_line_like_dict(get_value, related_model_class)
+    only_attrs = get_attrs_of_model(only)
+    if only_attrs:
+        return [attr for attr in model.attributes if attr == 'pk' or attr in only_attrs]
+    deferred_attrs = get_attrs_of_model(defer)
+    if use_model_deferred_fields:
+        deferred_attrs.update(model.deferred_fields)
+    return [attr for attr in model.attributes if attr == 'pk' or attr not in deferred_attrs]
 
 
-def get_all_output_like_model(model: 'BaseModel', output: list[DictOutputData]):
-    return [process_dict_line(model, dict_line) for dict_line in output]
+def get_related_paths_to_load(model: type, related: tuple[str, ...] = ()) -> list[tuple[str, type]]:
+    """
+    Возвращает пути к связанным моделям, которые создаются вместе с главной, и классы этих моделей:
+    непосредственно связанные модели и модели из 'related' (вместе с промежуточными), родительские - раньше
+    """
+    paths = dict.fromkeys(model.related_data)
+    for path in related:
+        paths.update(dict.fromkeys(get_related_paths_for_field(model, path + '__pk')))
+    return [(path, get_model_for_path(model, path)) for path in sorted(paths, key=lambda p: p.count('__'))]
 
 
-def process_dict_line(model: 'BaseModel', dict_line: DictOutputData) -> 'BaseModel':
+def get_fields_to_load(model: type, only: tuple[str, ...] = (), defer: tuple[str, ...] = (),
+                       use_model_deferred_fields: bool = True, related: tuple[str, ...] = ()) -> tuple[str, ...]:
     """
-    Заменяет словари (главный и вложенные) с данными на экземпляры моделей.
-    Возвращает готовую к использованию модель
+    Возвращает поля главной и связанных моделей (поля связанных - с префиксом), которые выбираются из БД
+    для создания моделей. 'only' - выбрать только эти поля (и pk), 'defer' - не выбирать эти поля.
+    Поля из 'deferred_fields' моделей не выбираются, если 'use_model_deferred_fields' не False.
+    'related' - пути к более глубоким связанным моделям (например, 'student__school_class'), которые тоже нужно создать
     """
-    for related_model, related_model_class in model.related_data.items():
-        dict_line[related_model] = get_dict_line_like_model(related_model_class, dict_line[related_model])
-    return get_dict_line_like_model(model, dict_line)
+    fields = []
+    for prefix, model_class in ((None, model), *get_related_paths_to_load(model, related)):
+        for attr in get_attributes_to_load(model_class, prefix, only, defer, use_model_deferred_fields):
+            fields.append(attr if prefix is None else f'{prefix}__{attr}')
+    return tuple(fields)
 
 
-def get_dict_line_like_model(model: 'BaseModel', dict_line: dict[str, ValuesTypesFromDB]) -> 'BaseModel':
-    pk = dict_line.pop('pk')
-    obj = model(**dict_line)
-    obj.pk = pk
+def get_rows_layout(model: type, fields: Iterable[str]) -> list[tuple[Optional[str], type, list[str]]]:
+    """
+    Возвращает расположение значений моделей в строке вывода, выбранной по полям 'fields':
+    [(связанная модель или None для главной, класс модели, имена хранения атрибутов), ...]
+    """
+    layout = {None: (model, [])}
+    for field in fields:
+        prefix, _, attr = field.rpartition('__')
+        prefix = prefix or None
+        if prefix not in layout:
+            layout[prefix] = (get_model_for_path(model, prefix), [])
+        model_class, storage_names = layout[prefix]
+        storage_names.append(model_class.storage_names[model_class.attributes.index(attr)])
+    return [(prefix, model_class, storage_names) for prefix, (model_class, storage_names) in layout.items()]
+
+
+def get_trusted_model(model: type, values: Iterator[ValuesTypesFromDB],
+                      storage_names: Optional[Iterable[str]] = None) -> 'BaseModel':
+    """
+    Создает экземпляр модели из следующих значений 'values', не вызывая '__init__' и валидаторы:
+    данные из БД уже прошли валидацию при записи.
+    'storage_names' - имена хранения выбранных атрибутов (по умолчанию - все атрибуты)
+    """
+    obj = object.__new__(model)
+    set_trusted_values(obj, model.storage_names if storage_names is None else storage_names, values)
     return obj
 
 
-def get_table_and_column_for_where_part(model: 'BaseModel', condition: str) -> tuple[str, str]:
-    condition = condition.split('__')
-    if len(condition) == 2 and condition[0] in model.related_data:
-        return model.related_data[condition[0]].db_table, condition[1]
-    return model.db_table, condition[0]
+def set_trusted_values(obj: 'BaseModel', storage_names: Iterable[str], values: Iterable[ValuesTypesFromDB]) -> None:
+    """Присваивает значения из БД атрибутам модели по именам хранения, не вызывая валидаторы"""
+    if obj.compact:
+        for storage_name, value in zip(storage_names, values):
+            setattr(obj, storage_name, value)
+    else:
+        obj.__dict__.update(zip(storage_names, values))
+
+
+def get_stored_value(obj: 'BaseModel', storage_name: str) -> Union[ModelValuesTypes, object]:
+    """Возвращает значение атрибута по имени хранения или 'not_loaded', если атрибут не загружен"""
+    if obj.compact:
+        try:
+            return object.__getattribute__(obj, storage_name)
+        except AttributeError:
+            return not_loaded
+    return obj.__dict__.get(storage_name, not_loaded)
+
 
+def is_changed_after_loading(obj: 'BaseModel', storage_name: str) -> bool:
+    """Изменен ли загруженный атрибут после загрузки из БД (или последней записи в БД)"""
+    value = get_stored_value(obj, storage_name)
+    if value is not_loaded:
+        return False
+    db_state = get_db_state_values(obj)
+    if db_state is None:
+        return True
+    index = obj.storage_names.index(storage_name)
+    return process_attr_and_value(obj.attributes[index], value, obj)[1] != db_state[index]
 
-def process_data_for_where_part(model: 'BaseModel', attr: str,
-                                value: ModelValuesTypes) -> tuple[str, Union[int, str]]:
+
+def refresh_trusted_values(obj: 'BaseModel', storage_names: Iterable[str],
+                           values: Iterable[ValuesTypesFromDB]) -> None:
+    """
+    Обновляет объект из карты соответствия значениями из БД. Незагруженные и неизмененные атрибуты
+    получают значения из БД, измененные, но не сохраненные - сохраняют значения, присвоенные пользователем
+    """
+    storage_names_to_set, values_to_set = [], []
+    for storage_name, value in zip(storage_names, values):
+        if not is_changed_after_loading(obj, storage_name):
+            storage_names_to_set.append(storage_name)
+            values_to_set.append(value)
+    set_trusted_values(obj, storage_names_to_set, values_to_set)
+    update_db_state(obj, storage_names, values)
+
+
+def get_model_from_db_row(model: type, row: RawOutputData,
+                          layout: Optional[list[tuple[Optional[str], type, list[str]]]] = None,
+                          identity_map: Optional['IdentityMap'] = None) -> 'BaseModel':
+    """
+    Быстрое создание модели (вместе со связанными моделями) из строки вывода БД без промежуточных словарей.
+    'layout' - расположение значений в строке (см. 'get_rows_layout'), по умолчанию - все атрибуты всех моделей.
+    Если передана 'identity_map', то модель, уже созданная по записи с тем же pk, не создается повторно,
+    а обновляется значениями из строки (см. 'refresh_trusted_values')
+    """
+    if layout is None:
+        values = iter(row)
+        obj = get_trusted_model(model, values)
+        for related_model, related_model_class in model.related_data.items():
+            setattr(obj, related_model, get_trusted_model(related_model_class, values))
+        return obj
+    objs, offset = {}, 0
+    for path, model_class, storage_names in layout:
+        next_offset = offset + len(storage_names)
+        obj = None
+        if identity_map is not None and storage_names and storage_names[0] == 'pk':
+            obj = identity_map.get(model_class, row[offset])
+        values = row[offset:next_offset]
+        if obj is None:
+            obj = get_trusted_model(model_class, iter(values), storage_names)
+            if len(storage_names) == len(model_class.storage_names):
+                set_db_state(obj, values)
+            else:
+                update_db_state(obj, storage_names, values)
+            if identity_map is not None:
+                identity_map.add(obj)
+        else:
+            refresh_trusted_values(obj, storage_names, values)
+        objs[path or ''] = obj
+        if path is not None:
+            parent_path, _, attr = path.rpartition('__')
+            parent = objs[parent_path]
+            if not is_changed_after_loading(parent, parent.storage_names[parent.attributes.index(attr)]):
+                setattr(parent, attr, obj)
+        offset = next_offset
+    return objs['']
+
+
+def get_table_and_column_for_condition(model: 'BaseModel', condition: str) -> tuple[str, str]:
+    """Возвращает таблицу (или ее псевдоним в запросе) и столбец, к которым относится условие выборки"""
+    table, owner, attr = resolve_field(model, condition)
     if attr == 'pk':
-        attr = 'id'
-    return process_attr_and_value(attr, value, model)
+        return table, 'id'
+    if attr in owner.related_data:
+        attr = attr + '_id'
+    return table, attr
+
+
+def split_lookup(condition: str) -> tuple[str, str]:
+    """
+    Отделяет от условия выборки оператор сравнения (например, 'pk__gt' -> ('pk', 'gt')).
+    Если оператор не указан, используется 'exact'
+    """
+    field_and_lookup = condition.rsplit('__', 1)
+    if len(field_and_lookup) == 2 and field_and_lookup[1] in lookups:
+        return field_and_lookup[0], field_and_lookup[1]
+    return condition, 'exact'
+
+
+def get_condition_name(condition: str, value: ModelValuesTypes) -> str:
+    """
+    Возвращает имя условия выборки, от которого зависит SQL. Проверка на NULL не передается аргументом
+    (иначе БД не может использовать индекс), а компилируется в 'IS NULL' или 'IS NOT NULL',
+    поэтому ее значение входит в имя: 'email__isnull'=False -> 'email__notnull'
+    """
+    field, lookup = split_lookup(condition)
+    if lookup in ('isnull', 'notnull') and not value:
+        return f'{field}__{"notnull" if lookup == "isnull" else "isnull"}'
+    return condition
+
+
+def get_condition_names(conditions: dict[str, ModelValuesTypes]) -> tuple[str, ...]:
+    """Возвращает имена условий выборки в порядке 'conditions' (см. 'get_condition_name')"""
+    return tuple(get_condition_name(condition, value) for condition, value in conditions.items())
+
 
+def get_sql_for_conditions(model: 'BaseModel', conditions: Iterable[str]) -> tuple[str, list[Identifier]]:
+    """Возвращает условия выборки, объединенные 'AND', не зависящие от значений условий"""
+    s, identifiers = [], []
+    for condition in conditions:
+        field, lookup = split_lookup(condition)
+        s.append(lookups[lookup])
+        identifiers += get_identifiers(*get_table_and_column_for_condition(model, field))
+    return ' AND '.join(s), identifiers
 
-def get_table_attr_value_for_where_part(model: 'BaseModel', condition: str,
-                                        value: ModelValuesTypes) -> tuple[str, str, Union[int, str]]:
-    table, attr = get_table_and_column_for_where_part(model, condition)
-    attr, value = process_data_for_where_part(model, attr, value)
-    return table, attr, value
+
+def get_sql_for_where_part_of_query(model: 'BaseModel',
+                                    where: Iterable[tuple[bool, Iterable[str]]]) -> tuple[str, list[Identifier]]:
+    """
+    Возвращает часть SQL запроса 'WHERE' для групп условий. Группы объединяются 'AND',
+    группа, помеченная True, отрицается ('NOT'). Если групп нет, возвращается пустая строка
+    """
+    s, identifiers = [], []
+    for negated, conditions in where:
+        conditions_sql, identifiers_for_conditions = get_sql_for_conditions(model, conditions)
+        s.append(f'NOT ({conditions_sql})' if negated else conditions_sql)
+        identifiers += identifiers_for_conditions
+    return (f'WHERE {" AND ".join(s)}' if s else ''), identifiers
+
+
+def get_sql_for_where_part(model: 'BaseModel', conditions: Iterable[str]) -> tuple[str, list[Identifier]]:
+    """Возвращает часть SQL запроса 'WHERE', не зависящую от значений условий"""
+    return get_sql_for_where_part_of_query(model, ((False, conditions),))
+
+
+def escape_like_pattern(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 
-def get_data_for_where_part_of_sql(model: 'BaseModel',
-                                   **kwargs: ModelValuesTypes) -> tuple[str, list[Identifier], list[int, str]]:
-    s, identifiers, arguments = [], [], []
-    for condition, condition_value in kwargs.items():
-        s.append('{}.{} = %s')
-        table, attr, condition_value = get_table_attr_value_for_where_part(model, condition, condition_value)
-        identifiers += get_identifiers(table, attr)
-        arguments.append(condition_value)
-    return f'WHERE {" AND ".join(s)}', identifiers, arguments
+def get_arguments_for_lookup(model: 'BaseModel', field: str, lookup: str,
+                             value: Union[ModelValuesTypes, Iterable[ModelValuesTypes]]) -> list:
+    """
+    Возвращает аргументы SQL запроса для одного условия выборки.
+    'in' - коллекция значений, 'range' - пара (начало, конец), 'icontains' - подстрока,
+    которая ищется без учета регистра. У 'isnull' аргументов нет (см. 'get_condition_name')
+    """
+    _, owner, attr = resolve_field(model, field)
+
+    def process_value(raw_value: ModelValuesTypes) -> Union[int, str]:
+        return get_pk_related_entry(raw_value) if attr in owner.related_data else raw_value
+
+    if lookup == 'in':
+        return [[process_value(v) for v in value]]
+    elif lookup == 'range':
+        start, finish = value
+        return [process_value(start), process_value(finish)]
+    elif lookup in ('isnull', 'notnull'):
+        return []
+    elif lookup == 'icontains':
+        return [f'%{escape_like_pattern(str(value))}%']
+    return [process_value(value)]
 
 
-def get_data_for_set_part_of_sql(model: 'BaseModel') -> tuple[str, list[Identifier], list[Union[int, str]]]:
-    attrs, arguments = get_data_to_write_to_db(model)
-    s = ', '.join('{} = %s' for _ in range(len(attrs)))
-    return f'SET {s}', get_identifiers(*attrs), arguments
+def get_arguments_for_where_part(model: 'BaseModel', conditions: Iterable[str],
+                                 values: dict[str, ModelValuesTypes]) -> list[Union[int, str]]:
+    """Возвращает значения условий в порядке 'conditions'"""
+    arguments = []
+    for condition in conditions:
+        arguments += get_arguments_for_lookup(model, *split_lookup(condition), values[condition])
+    return arguments
+
+
+def get_related_paths_for_fields(model: 'BaseModel', fields: Iterable[str]) -> set[str]:
+    """
+    Возвращает пути к связанным моделям, к полям которых обращаются 'fields'
+    (столбцы, условия выборки, сортировка), вместе с промежуточными моделями
+    """
+    related_paths = set()
+    for field in fields:
+        related_paths.update(get_related_paths_for_field(model, split_lookup(field.removeprefix('-'))[0]))
+    return related_paths
+
+
+def get_sql_for_columns_part(model: 'BaseModel', fields: Iterable[str],
+                             aggregates: Iterable['Aggregate'] = ()) -> tuple[str, list[Identifier]]:
+    """Возвращает часть SQL запроса 'SELECT ... FROM', выбирающую только поля 'fields' и агрегаты 'aggregates'"""
+    s, identifiers = [], []
+    for field in fields:
+        s.append('{}.{}')
+        identifiers += get_identifiers(*get_table_and_column_for_condition(model, field))
+    for aggregate in aggregates:
+        aggregate_sql, identifiers_for_aggregate = aggregate.get_sql(model)
+        s.append(aggregate_sql)
+        identifiers += identifiers_for_aggregate
+    return f'SELECT {", ".join(s)} FROM {{}}', identifiers
+
+
+def get_sql_for_order_by_part(model: 'BaseModel', ordering: Iterable[str]) -> tuple[str, list[Identifier]]:
+    """
+    Возвращает часть SQL запроса 'ORDER BY'. Поле с префиксом '-' сортируется по убыванию.
+    Если полей для сортировки нет, возвращается пустая строка
+    """
+    s, identifiers = [], []
+    for field in ordering:
+        s.append('{}.{} DESC' if field.startswith('-') else '{}.{}')
+        identifiers += get_identifiers(*get_table_and_column_for_condition(model, field.removeprefix('-')))
+    return (f'ORDER BY {", ".join(s)}' if s else ''), identifiers
+
+
+def get_sql_for_group_by_part(model: 'BaseModel', fields: Iterable[str]) -> tuple[str, list[Identifier]]:
+    """Возвращает часть SQL запроса 'GROUP BY'. Если полей для группировки нет, возвращается пустая строка"""
+    s, identifiers = [], []
+    for field in fields:
+        s.append('{}.{}')
+        identifiers += get_identifiers(*get_table_and_column_for_condition(model, field))
+    return (f'GROUP BY {", ".join(s)}' if s else ''), identifiers
+
+
+def get_sql_for_limit_part(has_limit: bool, has_offset: bool) -> str:
+    return ' '.join(part for part, is_used in (('LIMIT %s', has_limit), ('OFFSET %s', has_offset)) if is_used)
+
+
+def get_sql_for_set_part(columns: Iterable[str]) -> tuple[str, list[Identifier]]:
+    identifiers = get_identifiers(*columns)
+    s = ', '.join('{} = %s' for _ in range(len(identifiers)))
+    return f'SET {s}', identifiers
+
+
+def get_sql_for_values_part(columns_count: int, rows_count: int) -> str:
+    """Возвращает строку вида '(%s, %s), (%s, %s)' для записи нескольких строк одним запросом"""
+    row = f'({get_strings_for_sql(columns_count)[1]})'
+    return ', '.join(row for _ in range(rows_count))
+
+
+def get_sql_for_bulk_creation_method(columns: Iterable[str], rows_count: int) -> str:
+    columns = tuple(columns)
+    columns_sql = get_strings_for_sql(len(columns))[0]
+    return f'INSERT INTO {{}} ({columns_sql}) VALUES {get_sql_for_values_part(len(columns), rows_count)} RETURNING {{}}'
+
+
+def get_data_for_bulk_update_method(table: str, columns: Iterable[str],
+                                    rows_count: int) -> tuple[str, list[Identifier]]:
+    """
+    Возвращает SQL запроса, обновляющего несколько записей одним запросом, и его идентификаторы.
+    Новые значения передаются строками вида (pk, значение1, значение2, ...)
+    """
+    columns = tuple(columns)
+    set_part = ', '.join('{} = {}.{}' for _ in columns)
+    values_part = get_sql_for_values_part(len(columns) + 1, rows_count)
+    s = f'UPDATE {{}} SET {set_part} FROM (VALUES {values_part}) AS {{}} ({get_strings_for_sql(len(columns) + 1)[0]}) ' \
+        'WHERE {}.{} = {}.{}'
+    identifiers = get_identifiers(table)
+    for column in columns:
+        identifiers += get_identifiers(column, 'new_values', column)
+    identifiers += get_identifiers('new_values', 'id', *columns, table, 'id', 'new_values', 'id')
+    return s, identifiers
+
+
+def get_data_to_write_to_db_for_fields(model: 'BaseModel', fields: Iterable[str],
+                                       values: dict[str, ModelValuesTypes]) -> tuple[list[str], list[Union[int, str]]]:
+    """Возвращает столбцы и значения полей 'fields' из словаря 'values', подготовленные для записи в БД"""
+    columns, arguments = [], []
+    for field in fields:
+        if field == 'pk':
+            raise ValueError('Первичный ключ нельзя изменить')
+        add_data_to_lists(field, values[field], arguments, columns, model)
+    return columns, arguments
+
+
+def get_model_class(model: Union['BaseModel', type]) -> type:
+    return model if isinstance(model, type) else type(model)
+
+
+def is_select_statement(sql: Composable) -> bool:
+    """Является ли запрос выборкой ('SELECT'). Строка SQL не вычисляется"""
+    first_part = sql.seq[0] if isinstance(sql, Composed) and sql.seq else sql
+    return isinstance(first_part, SQL) and first_part.string.lstrip().upper().startswith('SELECT')
+
+
+def get_sql_with_numbered_placeholders(sql: str) -> tuple[str, int]:
+    """
+    Заменяет placeholders psycopg2 ('%s') на параметры PostgreSQL ('$1', '$2', ...),
+    чтобы SQL можно было подготовить командой 'PREPARE'. Возвращает SQL и количество параметров
+    """
+    numbers = count(1)
+    sql = re.sub('%[s%]', lambda match: '%' if match.group() == '%%' else f'${next(numbers)}', sql)
+    return sql, next(numbers) - 1
 
 
 def get_password_hash(password: str) -> str:
@@ -70,4 +70,14 @@ CREATE TABLE periods
     start      DATE NOT NULL,
     finish     DATE NOT NULL,
     is_current BOOLEAN
-);
\ No newline at end of file
+);
+
+CREATE INDEX classes_classroom_teacher_id_idx ON classes (classroom_teacher_id);
+
+CREATE INDEX students_school_class_id_is_active_second_name_idx ON students (school_class_id, is_active, second_name);
+
+CREATE INDEX subject_class_teacher_teacher_id_idx ON subject_class_teacher (teacher_id);
+CREATE INDEX subject_class_teacher_school_class_id_subject_id_idx ON subject_class_teacher (school_class_id, subject_id);
+
+CREATE INDEX grades_student_id_date_idx ON grades (student_id, date);
+CREATE INDEX grades_subject_id_student_id_date_idx ON grades (subject_id, student_id, date);
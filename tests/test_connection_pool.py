@@ -0,0 +1,76 @@
+import unittest
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from db_interaction.connection_pool import *
+from other.data_structures import PoolStatistics
+
+
+class FakeConnection:
+    """Заглушка соединения с БД, не требующая запущенного PostgreSQL"""
+
+    def __init__(self):
+        self.closed = 0
+        self.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.transaction_status
+
+    def rollback(self):
+        self.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool(FakeConnection, min_size=1, max_size=2, checkout_timeout=0)
+
+    def test_incorrect_sizes(self):
+        self.assertRaises(ValueError, ConnectionPool, FakeConnection, 3, 2)
+        self.assertRaises(ValueError, ConnectionPool, FakeConnection, 0, 0)
+
+    def test_connection_is_reused(self):
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+        self.assertIs(conn, self.pool.getconn())
+        self.assertEqual(PoolStatistics(checkouts=2, waits=0, connects=1, discards=0, size=1, idle=0),
+                         self.pool.statistics)
+
+    def test_pool_is_bounded(self):
+        self.pool.getconn()
+        self.pool.getconn()
+        self.assertRaises(ConnectionPoolExhausted, self.pool.getconn)
+        self.assertEqual(1, self.pool.statistics.waits)
+
+    def test_closed_connection_is_discarded(self):
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+        conn.closed = 1
+        self.assertIsNot(conn, self.pool.getconn())
+        self.assertEqual(1, self.pool.statistics.discards)
+
+    def test_unfinished_transaction_is_rolled_back(self):
+        conn = self.pool.getconn()
+        conn.transaction_status = TRANSACTION_STATUS_INTRANS
+        self.pool.putconn(conn)
+        self.assertEqual(TRANSACTION_STATUS_IDLE, conn.transaction_status)
+        self.assertIs(conn, self.pool.getconn())
+
+    def test_idle_connections_expire(self):
+        pool = ConnectionPool(FakeConnection, min_size=1, max_size=2, idle_timeout=-1)
+        first_conn, second_conn = pool.getconn(), pool.getconn()
+        pool.putconn(first_conn)
+        pool.putconn(second_conn)
+        self.assertTrue(first_conn.closed)
+        self.assertFalse(second_conn.closed)
+        self.assertEqual(1, pool.statistics.size)
+
+    def test_closeall(self):
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+        self.pool.closeall()
+        self.assertTrue(conn.closed)
+        self.assertEqual(0, self.pool.statistics.idle)
@@ -0,0 +1,63 @@
+import datetime
+import unittest
+
+from psycopg2.sql import SQL, Identifier
+
+from db_interaction.index_advisor import *
+from tests.utils_for_tests import data_for_conn
+from working_with_models.models import BaseModel
+
+
+class FakeCursor:
+    """Курсор, возвращающий заранее заданный план запроса и размеры таблиц"""
+
+    def __init__(self, plan: dict, tables_rows: dict[str, int]):
+        self.plan = plan
+        self.tables_rows = tables_rows
+        self.result = None
+
+    def execute(self, sql, args=None):
+        if isinstance(sql, str):
+            self.result = (self.tables_rows[args[0]],)
+        else:
+            self.result = ([{'Plan': self.plan}],)
+
+    def fetchone(self):
+        return self.result
+
+
+class TestFindSeqScans(unittest.TestCase):
+
+    def setUp(self):
+        plan = {'Node Type': 'Nested Loop', 'Plans': [
+            {'Node Type': 'Seq Scan', 'Relation Name': 'grades', 'Filter': '(student_id = 1)'},
+            {'Node Type': 'Seq Scan', 'Relation Name': 'subjects'},
+            {'Node Type': 'Index Scan', 'Relation Name': 'students'}]}
+        self.cur = FakeCursor(plan, {'grades': 10 ** 7, 'subjects': 20})
+        self.request = Request(SQL('SELECT 1'), [], 'with_output')
+
+    def test_only_large_tables_are_reported(self):
+        reports = find_seq_scans(self.cur, [self.request], 1000)
+        self.assertEqual([('grades', 10 ** 7, '(student_id = 1)')], [report[:3] for report in reports])
+
+
+class TestGetHotRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.previous_manager = BaseModel._manager
+        self.previous_period = State.current_period
+        TablesManager(Database(**data_for_conn))
+        State.current_period = get_trusted_model(Period, iter((1, datetime.date(2022, 9, 1),
+                                                               datetime.date(2022, 10, 31), True)))
+
+    def tearDown(self):
+        BaseModel._manager = self.previous_manager
+        State.current_period = self.previous_period
+        Database._Singleton__instance = None
+        TablesManager._Singleton__instance = None
+
+    def test_hot_requests_are_built_without_db(self):
+        requests = get_hot_requests()
+        self.assertTrue(all(isinstance(request, Request) for request in requests))
+        self.assertEqual([datetime.date(2022, 9, 1), datetime.date(2022, 10, 31), True, 1, 1], requests[1].args)
+        self.assertIn(Identifier('school_class_id'), requests[1].sql.seq)
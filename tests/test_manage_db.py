@@ -45,3 +45,65 @@ class TestDatabase(unittest.TestCase):
         self.assertRaises(TypeError, self.db.add_unexecuted_request, 123)
         self.db.add_unexecuted_request(Request(SQL('').format(Identifier('')), [], 'with_output'))
         self.assertTrue(bool(self.db._Database__unexecuted_requests))
+
+
+class TestGroupRequestsForBatchExecution(unittest.TestCase):
+
+    def test_for_correct_result(self):
+        sql_insert = SQL('INSERT INTO {} ({}) VALUES (%s)').format(Identifier('some_table'), Identifier('attr'))
+        sql_select = SQL('SELECT * FROM {}').format(Identifier('some_table'))
+        insert1, insert2, insert3 = (Request(sql_insert, [x], 'without_output') for x in range(3))
+        select = Request(sql_select, [], 'with_output')
+        expected_result = [[insert1, insert2], [select], [select], [insert3]]
+        result = group_requests_for_batch_execution([insert1, insert2, select, select, insert3])
+        self.assertEqual(expected_result, result)
+
+
+class FakeCursor:
+
+    def __init__(self):
+        self.connection = PreparingConnection.__new__(PreparingConnection)
+        self.connection.prepared_statements = set()
+        self.executed = []
+
+    def execute(self, sql, args=None):
+        self.executed.append(sql)
+
+
+class TestPreparedStatements(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(**data_for_conn, prepare_threshold=2)
+        self.cur = FakeCursor()
+
+    def tearDown(self):
+        Database._Singleton__instance = None
+
+    def get_sql_to_execute(self, request):
+        return self.db._Database__get_sql_to_execute(self.cur, request)
+
+    def test_select_is_prepared(self):
+        request = Request(SQL('SELECT * FROM t WHERE id = %s').format(), [1], 'with_output')
+        self.assertIs(request.sql, self.get_sql_to_execute(request))
+        self.assertEqual([SQL('EXECUTE '), Identifier('web_education_1')], self.get_sql_to_execute(request).seq[:2])
+        self.assertEqual(1, len(self.cur.executed))
+        self.get_sql_to_execute(request)
+        self.assertEqual(1, len(self.cur.executed))
+
+    def test_insert_is_not_prepared(self):
+        request = Request(SQL('INSERT INTO t VALUES (%s) RETURNING id').format(), [1], 'with_output')
+        for _ in range(3):
+            self.assertIs(request.sql, self.get_sql_to_execute(request))
+
+    def test_statements_usage_is_bounded(self):
+        self.db.statements_usage_size = 2
+        requests = [Request(SQL(f'SELECT {x}').format(), [], 'with_output') for x in range(3)]
+        for request in requests:
+            self.assertIs(request.sql, self.get_sql_to_execute(request))
+        statements_usage = self.db._Database__statements_usage
+        self.assertEqual(2, len(statements_usage))
+        self.assertNotIn(id(requests[0].sql), statements_usage)
+        self.assertIs(requests[0].sql, self.get_sql_to_execute(requests[0]))
+        self.assertEqual(1, statements_usage[id(requests[0].sql)].count)
+        self.assertEqual(2, len(statements_usage))
+        self.assertEqual([], self.cur.executed)
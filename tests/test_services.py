@@ -2,7 +2,7 @@ import unittest
 
 from tests.utils_for_tests import get_some_students, hash_func_for_model
 from user_interaction.services import *
-from working_with_models.models import Subject, Grade, Student
+from working_with_models.models import Subject, Grade, Student, Period
 
 
 class TestGetSubjectsForTable(unittest.TestCase):
@@ -39,6 +39,23 @@ class TestFillRawTable(unittest.TestCase):
         fill_raw_table_with_grades(empty_table, grades, 'subject')
         self.assertEqual(expected_result, empty_table)
 
+    def test_grade_outside_current_dates_is_skipped(self):
+        english = Subject('Английский язык')
+        State.current_dates = [datetime.date(2000, 1, 1)]
+        table = get_empty_table_dict([english])
+        fill_raw_table_with_grades(table, [Grade(5, 1, english, datetime.date(2000, 1, 2))], 'subject')
+        self.assertEqual({datetime.date(2000, 1, 1): {english: []}}, table)
+
+
+class TestSetCurrentDatesToState(unittest.TestCase):
+
+    def test_for_correct_result(self):
+        period = Period(datetime.date(2022, 9, 1), datetime.date(2022, 9, 3), False)
+        set_current_dates_to_state(period)
+        self.assertEqual([datetime.date(2022, 9, 1), datetime.date(2022, 9, 2), datetime.date(2022, 9, 3)],
+                         State.current_dates)
+        self.assertEqual((datetime.date(2022, 9, 1), datetime.date(2022, 9, 3)), get_current_period_range())
+
 
 class TestGetStrGradesForTable(unittest.TestCase):
 
@@ -265,3 +282,19 @@ class TestProcessValueFromAdminToChangeObj(unittest.TestCase):
         result = process_value_from_admin_to_change_obj('(31/8/2004)', 'start', Period)
         expected_result = datetime.date(2004, 8, 31)
         self.assertEqual(expected_result, result)
+
+
+class TestGetPksOfGradesToRemove(unittest.TestCase):
+
+    def test_for_correct_result(self):
+        date = datetime.date(2022, 9, 1)
+        saved_grades = [Grade(5, 1, 1, date), Grade(5, 1, 1, date), Grade(4, 2, 1, date)]
+        for pk, grade in enumerate(saved_grades, 1):
+            grade.pk = pk
+        grades = [Grade(5, 1, 1, date), Grade(5, 1, 1, date)]
+        self.assertEqual([2, 1], get_pks_of_grades_to_remove(grades, saved_grades))
+
+    def test_grade_not_in_db(self):
+        date = datetime.date(2022, 9, 1)
+        self.assertRaises(SemanticCommandError, get_pks_of_grades_to_remove, [Grade(3, 1, 1, date)],
+                          [Grade(5, 1, 1, date)])
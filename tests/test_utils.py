@@ -2,7 +2,8 @@ import unittest
 
 from other.utils import *
 from tests.utils_for_tests import get_some_model, init_for_main_model, init_for_related_model
-from working_with_models.models import BaseModel
+from other.data_structures import IdentityMap
+from working_with_models.models import BaseModel, Grade, Teacher, Student, Class, Subject
 
 
 class TestSingleton(unittest.TestCase):
@@ -94,131 +95,154 @@ class TestGetDataForJoinPartOfSql(unittest.TestCase):
         self.assertEqual(expected_result, result)
 
 
-class TestGetRawLineLikeDict(unittest.TestCase):
+class TestGetSqlForWherePart(unittest.TestCase):
 
     def test_for_correct_result(self):
-        raw_data = (0, 1, 2)
-        generator = get_value_from_collection(raw_data)
-        some_model = type('SomeModel', (BaseModel,),
-                          {'db_table': 'some_table', 'attributes': [f'attr{x}' for x in range(3)]})
-        expected_result = {'attr0': 0, 'attr1': 1, 'attr2': 2}
-        result = get_raw_line_like_dict(generator, some_model)
-        self.assertEqual(expected_result, result)
-
-
-class TestGetAllOutputLikeDict(unittest.TestCase):
-
-    def test_for_correct_result(self):
-        raw_data = [(0, 1, 1, 2), (10, 11, 11, 12)]  # начиная со второго индекса, значения - атрибуты связанной модели
+        s = 'WHERE {}.{} = %s AND {}.{} = %s'
+        identifiers = [Identifier('main_table'), Identifier('id'),
+                       Identifier('related_table'), Identifier('some_attr')]
+        conditions = {'pk': 1, 'related_model__some_attr': datetime.date(2004, 8, 31)}
         model = get_some_model()
-        expected_result = [{'pk': 0, 'related_model': {'pk': 1, 'some_attr': 2}},
-                           {'pk': 10, 'related_model': {'pk': 11, 'some_attr': 12}}]
-        result = get_all_output_like_dict(model, raw_data)
-        self.assertEqual(expected_result, result)
+        self.assertEqual((s, identifiers), get_sql_for_where_part(model, conditions))
+        self.assertEqual([1, datetime.date(2004, 8, 31)], get_arguments_for_where_part(model, conditions, conditions))
 
 
-class TestProcessRawLineOfOutput(unittest.TestCase):
+class TestGetSqlForSetPart(unittest.TestCase):
 
     def test_for_correct_result(self):
-        raw_line = (0, 1, 1, 2)
-        model = get_some_model()
-        expected_result = {'pk': 0, 'related_model': {'pk': 1, 'some_attr': 2}}
-        result = process_raw_line_of_output(raw_line, model)
-        self.assertEqual(expected_result, result)
+        expected_result = ('SET {} = %s', [Identifier('related_model_id')])
+        self.assertEqual(expected_result, get_sql_for_set_part(['related_model_id']))
 
 
-class TestReplacePkWithDict(unittest.TestCase):
+class TestGetSqlWithNumberedPlaceholders(unittest.TestCase):
 
     def test_for_correct_result(self):
-        raw_dict_line = {'pk': 1, 'related_model': 2}
-        generator = get_value_from_collection((2, 3))
-        model = get_some_model()
-        expected_result = {'pk': 1, 'related_model': {'pk': 2, 'some_attr': 3}}
-        replace_pk_with_dict(raw_dict_line, generator, model)
-        self.assertEqual(expected_result, raw_dict_line)
-
+        sql = "SELECT * FROM some_table WHERE some_attr = %s AND other_attr LIKE '%%a' AND pk = %s"
+        expected_result = ("SELECT * FROM some_table WHERE some_attr = $1 AND other_attr LIKE '%a' AND pk = $2", 2)
+        self.assertEqual(expected_result, get_sql_with_numbered_placeholders(sql))
 
-class TestGetAllOutputLikeModel(unittest.TestCase):
 
-    def test_for_correct_result(self):
-        output = [{'pk': 0, 'related_model': {'pk': 1, 'some_attr': 2}},
-                  {'pk': 10, 'related_model': {'pk': 11, 'some_attr': 12}}]
-        model = get_some_model()
-        model.__init__ = init_for_main_model
-        model.related_data['related_model'].__init__ = init_for_related_model
-        expected_result = '[' \
-                          'MainModel(pk: 0, related_model: RelatedModel(pk: 1, some_attr: 2)), ' \
-                          'MainModel(pk: 10, related_model: RelatedModel(pk: 11, some_attr: 12))' \
-                          ']'
-        result = get_all_output_like_model(model, output)
-        self.assertEqual(expected_result, result.__str__())
+class TestSplitLookup(unittest.TestCase):
 
+    def test_condition_with_lookup(self):
+        self.assertEqual(('related_model__pk', 'gt'), split_lookup('related_model__pk__gt'))
 
-class TestProcessDictLine(unittest.TestCase):
+    def test_condition_without_lookup(self):
+        self.assertEqual(('related_model__some_attr', 'exact'), split_lookup('related_model__some_attr'))
 
-    def test_for_correct_result(self):
-        output = {'pk': 0, 'related_model': {'pk': 1, 'some_attr': 2}}
-        model = get_some_model()
-        model.__init__ = init_for_main_model
-        model.related_data['related_model'].__init__ = init_for_related_model
-        expected_result = 'MainModel(pk: 0, related_model: RelatedModel(pk: 1, some_attr: 2))'
-        result = process_dict_line(model, output)
-        self.assertEqual(expected_result, result.__str__())
 
-
-class TestGetDictLineLikeModel(unittest.TestCase):
+class TestGetSqlForOrderByPart(unittest.TestCase):
 
     def test_for_correct_result(self):
-        output = {'pk': 1, 'some_attr': 2}
-        model = get_some_model().related_data['related_model']
-        model.__init__ = init_for_related_model
-        expected_result = 'RelatedModel(pk: 1, some_attr: 2)'
-        result = get_dict_line_like_model(model, output)
-        self.assertEqual(expected_result, result.__str__())
-
-
-class TestGetTableAndColumnForWherePart(unittest.TestCase):
-
-    @classmethod
-    def setUpClass(cls):
-        cls.model = get_some_model()
-
-    def test_for_condition_with_prefix(self):
-        expected_result = ('related_table', 'some_condition')
-        result = get_table_and_column_for_where_part(self.model, 'related_model__some_condition')
-        self.assertEqual(expected_result, result)
-
-    def test_for_condition_without_prefix(self):
-        expected_result = ('main_table', 'some_condition')
-        result = get_table_and_column_for_where_part(self.model, 'some_condition')
+        expected_result = ('ORDER BY {}.{} DESC, {}.{}', [Identifier('related_table'), Identifier('some_attr'),
+                                                        Identifier('main_table'), Identifier('id')])
+        result = get_sql_for_order_by_part(get_some_model(), ('-related_model__some_attr', 'pk'))
         self.assertEqual(expected_result, result)
 
+    def test_without_ordering(self):
+        self.assertEqual(('', []), get_sql_for_order_by_part(get_some_model(), ()))
 
-class ProcessAttrAndValueForWherePart(unittest.TestCase):
 
-    def test_for_pk_is_id(self):
-        result = process_data_for_where_part(get_some_model(), 'pk', 123)[0]
-        self.assertEqual('id', result)
+class TestGetDataForWherePartWithLookups(unittest.TestCase):
 
+    def test_sql_for_lookups(self):
+        s = ('WHERE {}.{} = ANY(%s) AND {}.{} BETWEEN %s AND %s AND {}.{} IS NOT NULL AND {}.{} ILIKE %s '
+             'AND {}.{} >= %s')
+        model = get_some_model()
+        conditions = {'pk__in': [1, 2], 'related_model__some_attr__range': (1, 5), 'related_model__isnull': False,
+                      'related_model__some_attr__icontains': 'a', 'pk__gte': 3}
+        self.assertEqual(s, get_sql_for_where_part(model, get_condition_names(conditions))[0])
+        self.assertEqual([[1, 2], 1, 5, '%a%', 3], get_arguments_for_where_part(model, conditions, conditions))
 
-class TestGetDataForWherePartOfSql(unittest.TestCase):
+    def test_isnull_is_part_of_condition_name(self):
+        self.assertEqual(('pk', 'email__isnull', 'date__notnull'),
+                         get_condition_names({'pk': 1, 'email__isnull': True, 'date__isnull': False}))
 
-    def test_for_correct_result(self):
-        s = 'WHERE {}.{} = %s AND {}.{} = %s'
-        identifiers = [Identifier('main_table'), Identifier('id'),
-                       Identifier('related_table'), Identifier('some_attr')]
-        arguments = [1, datetime.date(2004, 8, 31)]
-        expected_result = (s, identifiers, arguments)
+    def test_in_with_models(self):
         model = get_some_model()
-        result = get_data_for_where_part_of_sql(model, pk=1, related_model__some_attr=datetime.date(2004, 8, 31))
-        self.assertEqual(expected_result, result)
+        related_model = model.related_data['related_model']()
+        related_model.pk = 7
+        self.assertEqual([[7]], get_arguments_for_lookup(model, 'related_model', 'in', [related_model]))
+
+    def test_icontains_is_escaped(self):
+        self.assertEqual(['%10\\%\\_a%'], get_arguments_for_lookup(get_some_model(), 'related_model__some_attr',
+                                                                 'icontains', '10%_a'))
 
 
-class TestGetDataForSetPartOfSql(unittest.TestCase):
+class TestGetModelFromDbRow(unittest.TestCase):
 
     def test_for_correct_result(self):
-        expected_result = ('SET {} = %s', [Identifier('related_model_id')], [1])
-        model = get_some_model()()
-        model.related_model = 1
-        result = get_data_for_set_part_of_sql(model)
-        self.assertEqual(expected_result, result)
+        model = get_some_model()
+        model.__init__ = init_for_main_model
+        model.related_data['related_model'].__init__ = init_for_related_model
+        expected_result = 'MainModel(pk: 0, related_model: RelatedModel(pk: 1, some_attr: 2))'
+        result = get_model_from_db_row(model, (0, 1, 1, 2))
+        self.assertEqual(expected_result, str(result))
+
+    def test_validators_are_not_called(self):
+        student_row = (2, 'Ученик', 'Некоторый', 'Некоторович', 'some@email', 'a' * 64, 1, True)
+        grade = get_model_from_db_row(Grade, (1, 7, 2, 3, datetime.date(2022, 9, 1)) + student_row + (3, 'Математика'))
+        self.assertEqual(7, grade.value)
+        self.assertEqual('Математика', grade.subject.name)
+
+
+class TestGetFieldsToLoad(unittest.TestCase):
+
+    def test_model_deferred_fields(self):
+        self.assertNotIn('password', get_fields_to_load(Teacher))
+        self.assertIn('password', get_fields_to_load(Teacher, use_model_deferred_fields=False))
+
+    def test_only_and_defer(self):
+        self.assertEqual(('pk', 'related_model__pk'), get_fields_to_load(get_some_model(), only=('pk',),
+                                                                        defer=('related_model__some_attr',)))
+        self.assertEqual(('pk', 'related_model', 'related_model__pk'),
+                         get_fields_to_load(get_some_model(), defer=('related_model__some_attr',)))
+
+    def test_model_with_deferred_fields_from_db_row(self):
+        fields = ('pk', 'value', 'student', 'subject', 'date', 'student__pk', 'subject__pk', 'subject__name')
+        row = (1, 5, 2, 3, datetime.date(2022, 9, 1), 2, 3, 'Математика')
+        grade = get_model_from_db_row(Grade, row, get_rows_layout(Grade, fields))
+        self.assertEqual([('pk', 2)], list(grade.student))
+        self.assertEqual('Математика', grade.subject.name)
+
+
+class TestMultiLevelRelatedModels(unittest.TestCase):
+
+    def test_resolve_field(self):
+        self.assertEqual(('grades', Grade, 'value'), resolve_field(Grade, 'value'))
+        self.assertEqual(('students', Student, 'school_class'), resolve_field(Grade, 'student__school_class'))
+        self.assertEqual(('student__school_class', Class, 'number'),
+                         resolve_field(Grade, 'student__school_class__number'))
+        self.assertRaises(ValueError, resolve_field, Grade, 'subject__school_class__number')
+
+    def test_join_with_alias(self):
+        paths = get_related_paths_for_fields(Grade, ['student__school_class__classroom_teacher__second_name'])
+        self.assertEqual({'student', 'student__school_class', 'student__school_class__classroom_teacher'}, paths)
+        sql, identifiers = get_data_for_join_part_of_sql(Grade, paths)
+        self.assertEqual('JOIN {} ON {}.{} = {}.{} JOIN {} AS {} ON {}.{} = {}.{} '
+                         'JOIN {} AS {} ON {}.{} = {}.{}', sql)
+        self.assertEqual(get_identifiers('classes', 'student__school_class', 'students', 'school_class_id',
+                                         'student__school_class', 'id'), identifiers[5:11])
+
+    def test_nested_model_from_db_row(self):
+        fields = get_fields_to_load(Grade, only=('value', 'student__pk', 'subject__pk', 'student__school_class__number'),
+                                    related=('student__school_class',))
+        self.assertEqual(('pk', 'value', 'student__pk', 'subject__pk', 'student__school_class__pk',
+                          'student__school_class__number'), fields)
+        grade = get_model_from_db_row(Grade, (1, 5, 2, 3, 4, 11), get_rows_layout(Grade, fields))
+        self.assertEqual(11, grade.student.school_class.number)
+        self.assertEqual(4, grade.student.school_class.pk)
+
+
+class TestIdentityMap(unittest.TestCase):
+
+    def test_related_model_is_created_once(self):
+        fields = ('pk', 'value', 'student', 'subject', 'date', 'student__pk', 'subject__pk', 'subject__name')
+        layout = get_rows_layout(Grade, fields)
+        identity_map = IdentityMap()
+        rows = [(pk, 5, 2, 3, datetime.date(2022, 9, 1), 2, 3, 'Математика') for pk in (1, 2)]
+        first_grade, second_grade = (get_model_from_db_row(Grade, row, layout, identity_map) for row in rows)
+        self.assertIsNot(first_grade, second_grade)
+        self.assertIs(first_grade.student, second_grade.student)
+        self.assertIs(first_grade.subject, identity_map.get(Subject, 3))
+        self.assertEqual(4, len(identity_map))
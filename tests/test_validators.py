@@ -1,6 +1,8 @@
+import datetime
 import unittest
 
 from tests.utils_for_tests import get_some_instance
+from working_with_models.models import Grade, Teacher
 from working_with_models.validators import *
 
 
@@ -135,3 +137,64 @@ class TestGradeValueValidator(unittest.TestCase):
         instance = get_some_instance()
         self.validator.__set__(instance, 3)
         self.assertEqual(3, instance.attr)
+
+
+class TestCompactModel(unittest.TestCase):
+
+    def test_values_are_stored_in_slots(self):
+        grade = Grade(5, 1, 2, datetime.date(2022, 9, 1))
+        self.assertFalse(hasattr(grade, '__dict__'))
+        self.assertEqual(5, grade._value)
+        self.assertEqual([('pk', None), ('value', 5), ('student', 1), ('subject', 2),
+                          ('date', datetime.date(2022, 9, 1))], list(grade))
+
+    def test_validation_on_assignment(self):
+        grade = Grade(5, 1, 2, datetime.date(2022, 9, 1))
+        self.assertRaises(ValidationError, setattr, grade, 'value', 6)
+        self.assertIsInstance(Grade.value, GradeValueValidator)
+
+
+class FakeManager:
+    """Заглушка менеджера, возвращающая значение отложенного атрибута"""
+
+    def __init__(self, value):
+        self.value = value
+        self.requests_count = 0
+
+    def filter(self, **kwargs):
+        return self
+
+    def values_list(self, attr, flat=False):
+        self.requests_count += 1
+        return [self.value]
+
+
+class TestDeferredAttribute(unittest.TestCase):
+
+    def test_deferred_attribute_is_loaded_once(self):
+        grade = object.__new__(Grade)
+        grade.pk = 1
+        manager = FakeManager(4)
+        Grade._manager = manager
+        try:
+            self.assertEqual(4, grade.value)
+            self.assertEqual(4, grade.value)
+        finally:
+            del Grade._manager
+        self.assertEqual(1, manager.requests_count)
+
+    def test_attribute_of_new_model_is_not_loaded(self):
+        grade = object.__new__(Grade)
+        grade.pk = None
+        self.assertRaises(AttributeError, getattr, grade, 'value')
+
+    def test_deferred_validated_attribute_is_loaded(self):
+        teacher = object.__new__(Teacher)
+        teacher.pk = 1
+        Teacher._manager = FakeManager('a' * 64)
+        try:
+            self.assertEqual('a' * 64, teacher.password)
+        finally:
+            del Teacher._manager
+        self.assertEqual('a' * 64, teacher.password)
+        self.assertIsInstance(Teacher.password, PasswordValidator)
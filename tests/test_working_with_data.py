@@ -1,9 +1,16 @@
+import datetime
 import unittest
 
-from db_interaction.manage_db import Database
-from db_interaction.working_with_data import TablesManager
+from db_interaction.aggregates import Avg, Count, ArrayAgg
+from db_interaction.identity_map import session
+from db_interaction.manage_db import Database, confirm_executed_requests
+from db_interaction.working_with_data import TablesManager, RequestFactory, QuerySet, process_output, \
+    AsyncTablesManager
+from other.data_structures import DeferredOutput
+from other.utils import remember_db_state
+from psycopg2.sql import SQL, Identifier
 from tests.utils_for_tests import data_for_conn, get_some_model, init_for_main_model, init_for_related_model
-from working_with_models.models import BaseModel
+from working_with_models.models import BaseModel, Student, Subject, Grade
 
 
 class TestTablesManager(unittest.TestCase):
@@ -19,6 +26,7 @@ class TestTablesManager(unittest.TestCase):
         self.tb_manager._TablesManager__method = None
         self.db._Database__unexecuted_requests = []
         self.tb_manager.execution = False
+        self.tb_manager.deferred = False
 
     @classmethod
     def tearDownClass(cls):
@@ -79,5 +87,420 @@ class TestTablesManager(unittest.TestCase):
         self.tb_manager._TablesManager__process_kwargs(**{'execution': True})
         self.assertEqual({}, self.tb_manager.arguments_for_request)
 
+    def test_query_set_is_lazy(self):
+        query_set = get_some_model().manager.filter(pk=1)
+        self.assertIsInstance(query_set, QuerySet)
+        self.assertEqual([], self.db._Database__unexecuted_requests)
+        query_set = get_some_model().manager.all(deferred=True)
+        self.assertEqual(1, len(self.db._Database__unexecuted_requests))
+
+    def test_query_set_result_cache(self):
+        model = get_some_model()
+        model.__init__ = init_for_main_model
+        model.related_data['related_model'].__init__ = init_for_related_model
+        query_set = model.manager.filter(pk=0).enqueue()
+        self.db._Database__unexecuted_requests[0].output.set_output([(0, 1, 1, 2), (10, 11, 11, 12)])
+        self.assertEqual(2, len(query_set))
+        self.assertEqual('RelatedModel(pk: 11, some_attr: 12)', str(query_set[1].related_model))
+        self.assertIs(query_set[0], list(query_set)[0])
+
+    def test_query_set_slicing(self):
+        query_set = get_some_model().manager.filter(pk__gt=1)[5:15][2:20]
+        request = query_set.get_request()
+        self.assertEqual([1, 8, 7], request.args)
+        self.assertEqual(SQL(' > %s LIMIT %s OFFSET %s'), request.sql.seq[-1])
+        self.assertRaises(TypeError, query_set.filter, pk=1)
+        self.assertRaises(ValueError, query_set.__getitem__, slice(-1, None))
+
+    def test_page_after(self):
+        request = get_some_model().manager.all().page_after(10, 20).get_request()
+        where_and_order_by_part = request.sql.seq[request.sql.seq.index(SQL(' WHERE ')):]
+        self.assertEqual([SQL(' WHERE '), Identifier('main_table'), SQL('.'), Identifier('id'),
+                          SQL(' > %s ORDER BY '), Identifier('main_table'), SQL('.'), Identifier('id'),
+                          SQL(' LIMIT %s')], where_and_order_by_part)
+        self.assertEqual([10, 20], request.args)
+
+    def test_bulk_create(self):
+        model = get_some_model()
+        model.__init__ = init_for_main_model
+        objs = [model(1), model(2)]
+        model.manager.bulk_create(objs)
+        request = self.db._Database__unexecuted_requests[0]
+        self.assertEqual([1, 2], request.args)
+        request.output.set_output([(10,), (11,)])
+        self.assertEqual([None, None], [obj.pk for obj in objs])
+        confirm_executed_requests([request])
+        self.assertEqual([10, 11], [obj.pk for obj in objs])
+
+    def test_create_sets_pk(self):
+        model = get_some_model()
+        model.__init__ = init_for_main_model
+        obj = model(1)
+        obj.manager.create()
+        request = self.db._Database__unexecuted_requests[0]
+        self.assertEqual([SQL(') VALUES (%s) RETURNING '), Identifier('id')], request.sql.seq[-2:])
+        request.output.set_output([(7,)])
+        self.assertIsNone(obj.pk)
+        confirm_executed_requests([request])
+        self.assertEqual(7, obj.pk)
+
+    def test_query_set_delete(self):
+        get_some_model().manager.filter(pk__in=[1, 2]).delete()
+        request = self.db._Database__unexecuted_requests[0]
+        self.assertEqual('without_output', request.type)
+        self.assertEqual([[1, 2]], request.args)
+        self.assertEqual(SQL('DELETE FROM '), request.sql.seq[0])
+
     def test_getattr(self):
         self.assertRaises(AttributeError, self.tb_manager.__getattr__, 'some_method')
+
+    def test_set_deferred_value(self):
+        self.tb_manager._TablesManager__method = 'filter'
+        self.tb_manager._TablesManager__set_deferred_value({'deferred': True})
+        self.assertTrue(self.tb_manager.deferred)
+        self.assertRaises(TypeError, self.tb_manager._TablesManager__set_deferred_value, {'deferred': 1})
+        self.tb_manager._TablesManager__method = 'create'
+        self.assertRaises(TypeError, self.tb_manager._TablesManager__set_deferred_value, {'deferred': True})
+
+    def test_deferred_request(self):
+        model = get_some_model()
+        model.__init__ = init_for_main_model
+        model.related_data['related_model'].__init__ = init_for_related_model
+        deferred_output = model.manager.get(pk=0, deferred=True)
+        self.assertIsInstance(deferred_output, DeferredOutput)
+        self.assertFalse(deferred_output.done)
+        self.assertIs(deferred_output, self.db._Database__unexecuted_requests[0].output)
+        deferred_output.set_output([(0, 1, 1, 2)])
+        expected_result = 'MainModel(pk: 0, related_model: RelatedModel(pk: 1, some_attr: 2))'
+        self.assertEqual(expected_result, str(deferred_output.result))
+
+
+class TestRequestFactory(unittest.TestCase):
+
+    def setUp(self):
+        RequestFactory.statement_cache_clear()
+
+    def test_statement_cache(self):
+        model = get_some_model()
+        first_request = RequestFactory.filter(model, pk=1, related_model__some_attr=2)
+        second_request = RequestFactory.filter(model, related_model__some_attr=3, pk=4)
+        self.assertIs(first_request.sql, second_request.sql)
+        self.assertEqual([4, 3], second_request.args)
+        self.assertEqual(1, RequestFactory.statement_cache_info().hits)
+
+    def test_select_with_exclude(self):
+        model = get_some_model()
+        request = RequestFactory.select(model, ((False, {'pk': 1}), (True, {'related_model__some_attr': 2, 'pk': 3})))
+        where_part = request.sql.seq[request.sql.seq.index(SQL(' WHERE ')):]
+        self.assertEqual([SQL(' WHERE '), Identifier('main_table'), SQL('.'), Identifier('id'),
+                          SQL(' = %s AND NOT ('), Identifier('main_table'), SQL('.'), Identifier('id'),
+                          SQL(' = %s AND '), Identifier('related_table'), SQL('.'), Identifier('some_attr'),
+                          SQL(' = %s)')], where_part)
+        self.assertEqual([1, 3, 2], request.args)
+
+    def test_select_fields(self):
+        request = RequestFactory.select(get_some_model(), ((False, {'pk': 1}),), fields=('pk', 'related_model'))
+        self.assertEqual([SQL('SELECT '), Identifier('main_table'), SQL('.'), Identifier('id'), SQL(', '),
+                          Identifier('main_table'), SQL('.'), Identifier('related_model_id'), SQL(' FROM '),
+                          Identifier('main_table'), SQL(' WHERE ')], request.sql.seq[:11])
+
+    def test_select_fields_of_related_model(self):
+        request = RequestFactory.select(get_some_model(), fields=('related_model__some_attr',))
+        self.assertIn(SQL(' JOIN '), request.sql.seq)
+
+    def test_bulk_update(self):
+        model = get_some_model()
+        model.__init__ = init_for_main_model
+        objs = [model(1), model(2)]
+        objs[0].pk, objs[1].pk = 10, 11
+        request = RequestFactory.bulk_update(model, objs, ['related_model'])
+        self.assertEqual([10, 1, 11, 2], request.args)
+        self.assertIn(SQL(' FROM (VALUES (%s, %s), (%s, %s)) AS '), request.sql.seq)
+
+    def test_save_only_changed_attributes(self):
+        student_row = (2, 'Ученик', 'Некоторый', 'Некоторович', 'some@email', 1, False)
+        student = process_output(Student, [student_row], ('pk', 'first_name', 'second_name', 'patronymic',
+                                                           'email', 'school_class', 'is_active'))[0]
+        self.assertIsNone(RequestFactory.save(student))
+        student.is_active = True
+        request = RequestFactory.save(student)
+        self.assertEqual([True, 2], request.args)
+        self.assertEqual([SQL('UPDATE '), Identifier('students'), SQL(' SET '), Identifier('is_active')],
+                         request.sql.seq[:4])
+        remember_db_state(student)
+        self.assertIsNone(RequestFactory.save(student))
+
+    def test_db_state_of_compact_model_is_tuple_of_values(self):
+        grade_row = (1, 5, 2, 1, datetime.date(2022, 9, 1))
+        grade = process_output(Grade, [grade_row], ('pk', 'value', 'student', 'subject', 'date'))[0]
+        self.assertEqual((1, 5, 2, 1, datetime.date(2022, 9, 1)), grade._db_state)
+
+    def test_attributes_updated_in_bulk_are_saved_by_objects_loaded_before(self):
+        model = get_some_model()
+        obj = process_output(model, [(1, 2)], ('pk', 'related_model'))[0]
+        QuerySet(model, FakeQueuingDatabase()).filter(pk=1).update(related_model=5)
+        self.assertEqual([2, 1], RequestFactory.save(obj).args)
+        remember_db_state(obj, ('pk',))
+        self.assertEqual([2, 1], RequestFactory.save(obj).args)
+        obj = process_output(model, [(1, 5)], ('pk', 'related_model'))[0]
+        self.assertIsNone(RequestFactory.save(obj))
+
+    def test_update_selected(self):
+        request = RequestFactory.update_selected(get_some_model(), {'related_model': 5}, ((False, {'pk__gt': 1}),))
+        self.assertEqual([5, 1], request.args)
+        self.assertRaises(ValueError, RequestFactory.update_selected, get_some_model(), {'pk': 5})
+
+    def test_isnull_is_compiled_without_argument(self):
+        request = QuerySet(Grade, None).filter(pk__gt=1, student__isnull=False).get_request()
+        self.assertEqual([1], request.args)
+        self.assertTrue(get_sql_string(request).endswith(
+            'WHERE "grades"."id" > %s AND "grades"."student_id" IS NOT NULL'))
+        request = QuerySet(Grade, None).filter(pk__gt=1, student__isnull=True).get_request()
+        self.assertTrue(get_sql_string(request).endswith('"grades"."student_id" IS NULL'))
+
+
+class FakeDatabase:
+    """Заглушка БД, возвращающая вывод запроса частями"""
+
+    def __init__(self, rows: list[tuple]):
+        self.rows = rows
+        self.chunks_count = 0
+
+    def iterate_request(self, request, chunk_size):
+        for i in range(0, len(self.rows), chunk_size):
+            self.chunks_count += 1
+            yield self.rows[i: i + chunk_size]
+
+
+class TestQuerySetIterator(unittest.TestCase):
+
+    def test_for_correct_result(self):
+        model = get_some_model()
+        model.__init__ = init_for_main_model
+        model.related_data['related_model'].__init__ = init_for_related_model
+        db = FakeDatabase([(pk, 1, 1, 2) for pk in range(5)])
+        iterator = QuerySet(model, db).iterator(chunk_size=2)
+        self.assertEqual(0, next(iterator).pk)
+        self.assertEqual(1, db.chunks_count)
+        self.assertEqual([1, 2, 3, 4], [obj.pk for obj in iterator])
+        self.assertEqual(3, db.chunks_count)
+
+    def test_values(self):
+        db = FakeDatabase([(1, 2), (3, 4)])
+        query_set = QuerySet(get_some_model(), db)
+        self.assertEqual([{'pk': 1, 'related_model': 2}, {'pk': 3, 'related_model': 4}],
+                         list(query_set.values().iterator()))
+        self.assertEqual([(1, 2), (3, 4)], list(query_set.values_list('pk', 'related_model').iterator()))
+        self.assertEqual([1, 3], list(query_set.values_list('pk', flat=True).iterator()))
+        self.assertRaises(TypeError, query_set.values_list, 'pk', 'related_model', flat=True)
+
+
+def get_sql_string(request) -> str:
+    """SQL запроса без подключения к БД (идентификаторы в двойных кавычках)"""
+    return ''.join(part.string if isinstance(part, SQL) else '"{}"'.format(*part.strings) for part in request.sql.seq)
+
+
+class FakeQueuingDatabase:
+    """Заглушка БД, сразу отдающая выводы запросов из очереди по порядку"""
+
+    def __init__(self, *outputs: list[tuple]):
+        self.outputs = list(outputs)
+        self.requests = []
+
+    def add_unexecuted_request(self, request):
+        self.requests.append(request)
+        if request.output is None:
+            return None
+        request.output.set_output(self.outputs.pop(0) if request.type == 'with_output' else [])
+        request.output.confirm()
+        return request.output
+
+
+class TestPrefetchRelated(unittest.TestCase):
+
+    def test_for_correct_result(self):
+        student_rows = [(pk, 'Ученик', 'Некоторый', 'Некоторович', f'{pk}@email', 1, True, 1, 5, 'А', 1)
+                        for pk in (1, 2)]
+        grade_rows = [(pk, 5, 2, 1, datetime.date(2022, 9, pk), 2, 'Ученик', 'Некоторый', 'Некоторович',
+                       '2@email', 1, True, 1, 'Математика') for pk in (1, 2)]
+        db = FakeQueuingDatabase(student_rows, grade_rows)
+        students = list(QuerySet(Student, db).prefetch_related('grade_set'))
+        self.assertEqual(2, len(db.requests))
+        self.assertEqual([[1, 2]], db.requests[1].args)
+        self.assertEqual([], students[0].grade_set)
+        self.assertEqual([1, 2], [grade.pk for grade in students[1].grade_set])
+        self.assertIs(students[1], students[1].grade_set[0].student)
+        self.assertNotIn('_prefetched_objects', dict(students[1]))
+
+    def test_unknown_relation(self):
+        self.assertRaises(ValueError, QuerySet(Student, None).prefetch_related, 'class_set')
+
+    def test_prefetch_to_compact_model(self):
+        class Parent(BaseModel, compact=True):
+            db_table = 'parents'
+            attributes = ['pk']
+
+        class Child(BaseModel):
+            db_table = 'children'
+            attributes = ['pk', 'parent']
+            related_data = {'parent': Parent}
+
+        parent = process_output(Parent, [(1,)], ('pk',))[0]
+        Parent.reverse_related_data['child_set'].set_prefetched(parent, [])
+        self.assertEqual([], parent.child_set)
+
+
+class TestSession(unittest.TestCase):
+
+    def test_same_object_within_session(self):
+        rows = [(1, 'Математика')]
+        with session():
+            first_subject = list(QuerySet(Subject, FakeQueuingDatabase(rows)))[0]
+            second_subject = list(QuerySet(Subject, FakeQueuingDatabase(rows)))[0]
+        self.assertIs(first_subject, second_subject)
+        self.assertIsNot(first_subject, list(QuerySet(Subject, FakeQueuingDatabase(rows)))[0])
+
+    def test_mapped_object_is_refreshed(self):
+        with session():
+            subject = list(QuerySet(Subject, FakeQueuingDatabase([(1, 'Математика')])).only('pk'))[0]
+            reloaded_subject = list(QuerySet(Subject, FakeQueuingDatabase([(1, 'Физика')])))[0]
+        self.assertIs(subject, reloaded_subject)
+        self.assertEqual('Физика', subject.name)
+        self.assertIsNone(RequestFactory.save(subject))
+
+    def test_unsaved_changes_survive_reload(self):
+        with session():
+            subject = list(QuerySet(Subject, FakeQueuingDatabase([(1, 'Математика')])))[0]
+            subject.name = 'Физика'
+            reloaded_subject = list(QuerySet(Subject, FakeQueuingDatabase([(1, 'Математика')])))[0]
+        self.assertIs(subject, reloaded_subject)
+        self.assertEqual('Физика', subject.name)
+        self.assertEqual(['Физика', 1], RequestFactory.save(subject).args)
+
+    def test_iterator_does_not_fill_session(self):
+        db = FakeDatabase([(pk, 'Математика') for pk in range(10)])
+        with session() as identity_map:
+            subjects = QuerySet(Subject, db).iterator(chunk_size=3)
+            self.assertEqual(list(range(10)), [subject.pk for subject in subjects])
+            self.assertEqual(0, len(identity_map))
+
+
+class TestAggregation(unittest.TestCase):
+
+    def test_group_by(self):
+        request = RequestFactory.select(Grade, ((False, {'student': 1}),), fields=('subject__name',),
+                                        aggregates=(Avg('value'),))
+        self.assertEqual('SELECT "subjects"."name", AVG("grades"."value")::float FROM "grades" '
+                         'JOIN "subjects" ON "grades"."subject_id" = "subjects"."id" '
+                         'WHERE "grades"."student_id" = %s GROUP BY "subjects"."name"', get_sql_string(request))
+
+    def test_array_agg(self):
+        request = RequestFactory.select(Grade, fields=('date', 'student'), aggregates=(ArrayAgg('value'),))
+        self.assertEqual('SELECT "grades"."date", "grades"."student_id", '
+                         'ARRAY_AGG("grades"."value" ORDER BY "grades"."id") FROM "grades" '
+                         'GROUP BY "grades"."date", "grades"."student_id"', get_sql_string(request))
+
+    def test_aggregate(self):
+        db = FakeQueuingDatabase([(4.5, 2)])
+        result = QuerySet(Grade, db).filter(student=1).aggregate(Avg('value'), count=Count())
+        self.assertEqual({'value__avg': 4.5, 'count': 2}, result)
+        self.assertEqual('SELECT AVG("grades"."value")::float, COUNT("grades"."id") FROM "grades" '
+                         'WHERE "grades"."student_id" = %s', get_sql_string(db.requests[0]))
+
+    def test_count_and_exists(self):
+        self.assertEqual(3, QuerySet(Grade, FakeQueuingDatabase([(3,)])).count())
+        self.assertTrue(QuerySet(Grade, FakeQueuingDatabase([(1,)])).exists())
+        self.assertFalse(QuerySet(Grade, FakeQueuingDatabase([])).exists())
+
+    def test_annotate(self):
+        db = FakeQueuingDatabase([('Математика', 4.5)])
+        query_set = QuerySet(Grade, db).values('subject__name').annotate(average=Avg('value'))
+        self.assertEqual([{'subject__name': 'Математика', 'average': 4.5}], list(query_set))
+        self.assertRaises(TypeError, QuerySet(Grade, db).annotate, Avg('value'))
+
+    def test_annotate_with_ordering_by_not_grouped_field(self):
+        query_set = QuerySet(Grade, None).values('student')
+        self.assertRaises(ValueError, query_set.order_by('date').annotate, Avg('value'))
+        self.assertRaises(ValueError, query_set.annotate(Avg('value')).order_by, '-date')
+        query_set.order_by('-student').annotate(Avg('value'))
+
+
+class FakeAsyncDatabase:
+    """Заглушка асинхронной БД, отдающая выводы запросов по порядку"""
+
+    def __init__(self, *outputs: list[tuple]):
+        self.outputs = list(outputs)
+        self.requests = []
+        self.fail = False
+
+    async def fetch(self, request):
+        self.requests.append(request)
+        output = self.outputs.pop(0)
+        if request.output is not None:
+            request.output.set_output(output)
+        confirm_executed_requests([request])
+        return output
+
+    def add_unexecuted_request(self, request):
+        raise TypeError
+
+    async def execute(self, request):
+        self.requests.append(request)
+        if self.fail:
+            raise RuntimeError
+        confirm_executed_requests([request])
+
+
+class TestAsyncTablesManager(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.previous_manager = BaseModel._manager
+        self.db = FakeAsyncDatabase([(1, 'Математика')], [(2,)])
+        self.manager = AsyncTablesManager(self.db)
+
+    def tearDown(self):
+        BaseModel._manager = self.previous_manager
+        AsyncTablesManager._Singleton__instance = None
+
+    async def test_await_query_set(self):
+        query_set = Subject.manager.filter(name='Математика')
+        self.assertEqual(['Математика'], [subject.name for subject in await query_set])
+        self.assertEqual(['Математика'], [subject.name for subject in query_set])
+        self.assertEqual(1, len(self.db.requests))
+
+    async def test_model_is_remembered_when_method_is_called(self):
+        self.db.outputs = [[(1,)]]
+        subject = Subject('Физика')
+        creation = subject.manager.create()
+        Grade.manager.all()
+        await creation
+        self.assertEqual(1, subject.pk)
+        self.assertIn(Identifier('subjects'), self.db.requests[0].sql.seq)
+
+    async def test_save_without_changes_is_skipped(self):
+        subject = await Subject.manager.get(pk=1)
+        await subject.manager.save()
+        self.assertEqual(1, len(self.db.requests))
+
+    async def test_aggregation(self):
+        self.db.outputs = [[(4.5,)], [(3,)], []]
+        query_set = Grade.manager.filter(student=1)
+        self.assertEqual({'value__avg': 4.5}, await query_set.aaggregate(Avg('value')))
+        self.assertEqual(3, await query_set.acount())
+        self.assertFalse(await query_set.aexists())
+        self.assertRaises(TypeError, query_set.count)
+
+    async def test_model_deferred_fields_are_selected(self):
+        self.assertIn(Identifier('password'), Student.manager.all().get_request().sql.seq)
+        self.assertRaises(TypeError, lambda: Student.manager.all()[0])
+
+    async def test_db_state_is_remembered_after_execution(self):
+        subject = await Subject.manager.get(pk=1)
+        subject.name = 'Физика'
+        self.db.fail = True
+        with self.assertRaises(RuntimeError):
+            await subject.manager.save()
+        self.assertIsNotNone(RequestFactory.save(subject))
+        self.db.fail = False
+        await subject.manager.save()
+        self.assertIsNone(RequestFactory.save(subject))
@@ -155,6 +155,13 @@ def print_objs_for_the_user_to_select(obj_name: str, objs: Iterable) -> None:
     print('\n'.join(f'[{i}] - {schl_cls}' for i, schl_cls in enumerate(objs, 1)))
 
 
+def pages_navigation_msg(has_previous_page: bool, has_next_page: bool) -> None:
+    if has_previous_page:
+        print('[<] - предыдущая страница')
+    if has_next_page:
+        print('[>] - следующая страница')
+
+
 def what_to_do_with_grades_msg() -> None:
     print('Действия с оценками:')
     print('[1] - добавить')
@@ -1,17 +1,21 @@
 import datetime
+from collections import defaultdict
 from getpass import getpass
 from string import digits
-from typing import Type, Union, Literal, Callable, Optional, Any
+from typing import Type, Union, Literal, Optional, Any, Iterable
 
 import psycopg2.errors
 from prettytable import PrettyTable
 
+from db_interaction.aggregates import ArrayAgg
+from db_interaction.working_with_data import QuerySet
 from other.exceptions import InstanceCantExist, InvalidData, ValidationError, \
     NoSubjectsTaughtByTheTeacher, SemanticCommandError, ExitGradingCommand, InvalidDate, NoObjsToChooseFrom
-from other.utils import ModelValuesTypes
+from other.utils import ModelValuesTypes, get_pk_related_entry
 from user_interaction.enums import EnumConstructor, ProfileType, SaveChanges, WhatToDoWithGrades
 from user_interaction.messages import print_error, separate_action, print_grading_instruction, preliminary_grades_msg, \
-    print_objs_for_the_user_to_select, what_to_do_with_grades_msg, delete_obj_msg, warning_before_deletion_msg
+    print_objs_for_the_user_to_select, what_to_do_with_grades_msg, delete_obj_msg, warning_before_deletion_msg, \
+    pages_navigation_msg
 from user_interaction.requesting_data_from_user import get_answer, get_choice, request_data
 from working_with_models.models import Teacher, Student, Class, Administrator, Grade, Period, SubjectClassTeacher, \
     Subject, User, BaseModel
@@ -28,6 +32,8 @@ UserTypes = Union[Teacher, Student, Administrator]
 months_ru = ('Января', 'Февраля', 'Марта', 'Апреля', 'Мая', 'Июня',
              'Июля', 'Августа', 'Сентября', 'Октября', 'Ноября', 'Декабря')
 
+objs_page_size = 20
+
 dependent_models = {Teacher: (Class, SubjectClassTeacher, Grade), Class: (SubjectClassTeacher, Student),
                     Subject: (SubjectClassTeacher, Grade), Student: (Grade,)}
 
@@ -35,7 +41,9 @@ dependent_models = {Teacher: (Class, SubjectClassTeacher, Grade), Class: (Subjec
 class State:
     """
     'Current_dates' - активные даты, с которыми можно работать
-    (ставить и просматривать оценки). Например, четверть или полугодие
+    (ставить и просматривать оценки). Например, четверть или полугодие.
+    'Current_period' - период, которому принадлежат эти даты; его границы
+    используются в запросах оценок
     Такая изначальная структура 'cache' нужна для корректной работы функции,
     которая соотносит ученика и его порядковый номер в классе (1, 2, 3 и т.д.)
     """
@@ -43,6 +51,7 @@ class State:
     db = None
     cache = {'students': [None]}
     user = None
+    current_period = None
     current_dates = None
 
     def __new__(cls, *args, **kwargs):
@@ -71,12 +80,36 @@ def get_obj_from_user(objs: list, obj_name_str: str) -> Any:
     return objs[int(obj_number) - 1]
 
 
+def get_obj_from_user_by_pages(objs: QuerySet, obj_name_str: str, page_size: int = objs_page_size) -> Any:
+    """
+    Выбор объекта из набора записей, который может быть большим.
+    Записи запрашиваются из БД постранично, по 'page_size' штук (keyset pagination по 'pk')
+    """
+    pages_keys = [None]
+    while True:
+        page = list(objs.page_after(pages_keys[-1], page_size + 1))
+        has_next_page, page = len(page) > page_size, page[:page_size]
+        if not page:
+            raise NoObjsToChooseFrom('Нет объектов для выбора')
+        choices = [(repr(c), str(i)) for i, c in enumerate(page, 1)]
+        choices += [(name, value) for name, value, is_available in
+                    (('previous_page', '<', len(pages_keys) > 1), ('next_page', '>', has_next_page)) if is_available]
+        print_objs_for_the_user_to_select(obj_name_str, page)
+        pages_navigation_msg(len(pages_keys) > 1, has_next_page)
+        choice = get_choice(EnumConstructor('ObjsEnum', choices)).value
+        if choice == '>':
+            pages_keys.append(page[-1].pk)
+        elif choice == '<':
+            pages_keys.pop()
+        else:
+            return page[int(choice) - 1]
+
+
 def get_additional_field(model_class: Type[User]) -> Union[None, str, Class]:
     if model_class is Teacher:
         return get_answer('Введите информацию об учителе (например: Учитель географии, стаж - 20 лет):')
     elif model_class is Student:
-        classes = Class.manager.all()
-        return get_obj_from_user(classes, 'класс')
+        return get_obj_from_user_by_pages(Class.manager.all(), 'класс')
 
 
 def try_to_insert_obj_to_db(obj: BaseModel, method: Literal['save', 'create']) -> bool:
@@ -99,10 +132,16 @@ def create_dict_with_user_data(model_class: Type[UserTypes]) -> dict[str, str]:
 
 
 def set_current_dates_to_state(current_period: Period) -> None:
+    State.current_period = current_period
     State.current_dates = [current_period.start + datetime.timedelta(dt_dlt) for dt_dlt in
                            range((current_period.finish - current_period.start).days + 1)]
 
 
+def get_current_period_range() -> tuple[datetime.date, datetime.date]:
+    """Возвращает границы текущего периода для условия выборки 'date__range'"""
+    return State.current_period.start, State.current_period.finish
+
+
 def set_columns_in_table(objs: list[Union[Subject, Student]]) -> dict[Union[Subject, Student], list]:
     return {obj: [] for obj in objs}
 
@@ -120,9 +159,9 @@ def get_empty_table_dict(objs: list[Union[Subject, Student]]) \
 def fill_raw_table_with_grades(table: dict[datetime.date, dict[Subject, list]],
                                grades: list[Grade], attr: Literal['subject', 'student']) -> None:
     for grade in grades:
-        if grade.date not in State.current_dates:
-            continue
-        table[grade.date][getattr(grade, attr)].append(str(grade.value))
+        row = table.get(grade.date)
+        if row is not None:
+            row[getattr(grade, attr)].append(str(grade.value))
 
 
 def get_pretty_table() -> PrettyTable:
@@ -154,14 +193,14 @@ def prepare_pretty_table_for_tchs_list(table: PrettyTable) -> None:
     table.field_names = ('Предмет', 'Учитель')
 
 
-def get_fio(user: User) -> str:
-    return f'{user.second_name} {user.first_name} {user.patronymic}'
+def get_fio(second_name: str, first_name: str, patronymic: str) -> str:
+    return f'{second_name} {first_name} {patronymic}'
 
 
-def fill_pretty_table_with_tchs(table: PrettyTable, teachers_subjects: list[SubjectClassTeacher]) -> None:
-    """Заполняет пустую таблицу учителями и предметами"""
-    for t_s in teachers_subjects:
-        table.add_row([t_s.subject.name, get_fio(t_s.teacher)])
+def fill_pretty_table_with_tchs(table: PrettyTable, teachers_subjects: Iterable[tuple[str, str, str, str]]) -> None:
+    """Заполняет пустую таблицу учителями и предметами. Строка: (предмет, фамилия, имя, отчество учителя)"""
+    for subject_name, *teacher_fio in teachers_subjects:
+        table.add_row([subject_name, get_fio(*teacher_fio)])
 
 
 def get_str_grades_for_table(grades: dict[Subject, list]) -> list[str]:
@@ -183,15 +222,55 @@ def get_subjects_to_select(subjects: list[Subject]) -> list[tuple[str, str]]:
     return [(subject.name, str(subject.pk)) for subject in subjects]
 
 
-def get_table_with_students_grades_for_print(students: list[Student], subject: Subject) -> PrettyTable:
-    """Возвращает таблицу (или часть таблицы) с оценками учеников для вывода в консоль"""
+def get_class_students(school_class: Class) -> QuerySet:
+    """Активные ученики класса в алфавитном порядке"""
+    return Student.manager.filter(school_class=school_class, is_active=True).order_by('second_name')
+
+
+def get_student_grades(student: Student) -> QuerySet:
+    """Оценки ученика за текущий период"""
+    return Grade.manager.filter(student=student, date__range=get_current_period_range())
+
+
+def get_class_subjects(school_class: Class) -> QuerySet:
+    """Предметы класса вместе с учителями, которые их ведут"""
+    return SubjectClassTeacher.manager.filter(school_class=school_class)
+
+
+def get_teacher_subjects(teacher: Optional[Teacher] = None) -> QuerySet:
+    """Предметы и классы, которые ведет учитель (без учителя - все)"""
+    if teacher is None:
+        return SubjectClassTeacher.manager.all()
+    return SubjectClassTeacher.manager.filter(teacher=teacher)
+
+
+def get_classes_of_classroom_teacher(teacher: Teacher) -> QuerySet:
+    return Class.manager.filter(classroom_teacher=teacher)
+
+
+def get_class_gradebook(school_class: Class, subject: Subject) -> QuerySet:
+    """
+    Журнал класса по предмету за текущий период: строки (дата, pk ученика, [оценки]).
+    Оценки группируются по дате и ученику в БД, поэтому вся матрица оценок класса выбирается одним запросом
+    """
+    return Grade.manager.filter(subject=subject, student__school_class=school_class, student__is_active=True,
+                                date__range=get_current_period_range()) \
+        .values_list('date', 'student').annotate(ArrayAgg('value'))
+
+
+def get_table_with_students_grades_for_print(students: list[Student],
+                                             gradebook: dict[tuple[datetime.date, int], list[int]]) -> PrettyTable:
+    """
+    Возвращает таблицу (или часть таблицы) с оценками учеников для вывода в консоль.
+    'gradebook' - оценки класса по датам и pk учеников (см. 'get_class_gradebook')
+    """
 
     pretty_table = get_pretty_table()
     prepare_pretty_table_for_grades(pretty_table, students)
     raw_table = get_empty_table_dict(students)
-    grades = Grade.manager.filter(subject=subject)
-    grades = list(filter(lambda grade: grade.student in students, grades))
-    fill_raw_table_with_grades(raw_table, grades, 'student')
+    for grade_date, row in raw_table.items():
+        for student in students:
+            row[student].extend(str(value) for value in gradebook.get((grade_date, student.pk), ()))
     fill_pretty_table_with_grades(raw_table, pretty_table)
     return pretty_table
 
@@ -199,10 +278,12 @@ def get_table_with_students_grades_for_print(students: list[Student], subject: S
 def print_class_grades_table(school_class: Class, subject: Subject) -> None:
     """Печатает все оценки, полученные учениками определеннего класса по определенному предмету"""
 
-    students = sorted(Student.manager.filter(school_class=school_class, is_active=True), key=lambda st: st.second_name)
+    students = get_class_students(school_class).enqueue()
+    gradebook = {(grade_date, student_pk): values
+                 for grade_date, student_pk, values in get_class_gradebook(school_class, subject).enqueue()}
     for index in range(0, len(students), 7):
         students_part = students[index: index + 7]
-        table = get_table_with_students_grades_for_print(students_part, subject)
+        table = get_table_with_students_grades_for_print(students_part, gradebook)
         separate_action()
         print(table)
 
@@ -327,10 +408,7 @@ def get_preliminary_grades(subject: Subject) -> Union[None, list[tuple[Student,
 
 
 def get_data_to_rate_students(teacher: Optional[Teacher] = None) -> tuple[Class, Subject]:
-    if teacher is None:
-        s_c_t = SubjectClassTeacher.manager.all()
-    else:
-        s_c_t = SubjectClassTeacher.manager.filter(teacher=teacher)
+    s_c_t = get_teacher_subjects(teacher)
     if not s_c_t:
         raise NoSubjectsTaughtByTheTeacher
     classes = get_unique_elements(get_objs_from_sct(s_c_t, 'school_class'))
@@ -352,24 +430,41 @@ def get_unique_elements(objs: list[BaseModel]) -> list[BaseModel]:
 
 
 def save_grades_from_grading_command(preliminary_grades: list[tuple[Student, list[Grade]]]) -> None:
-    iterate_over_preliminary_grades(preliminary_grades, lambda gr: gr.manager.create())
+    Grade.manager.bulk_create(get_grades_from_preliminary_grades(preliminary_grades))
 
 
-def iterate_over_preliminary_grades(preliminary_grades: list[tuple[Student, list[Grade]]], func: Callable) -> None:
-    for user_and_his_grades in preliminary_grades:
-        for grade in user_and_his_grades[1]:
-            func(grade)
+def get_grades_from_preliminary_grades(preliminary_grades: list[tuple[Student, list[Grade]]]) -> list[Grade]:
+    return [grade for _, grades in preliminary_grades for grade in grades]
 
 
-def remove_one_grade_from_grading_command(grade: Grade) -> None:
-    grades = Grade.manager.filter(value=grade.value, student=grade.student, subject=grade.subject, date=grade.date)
-    if not grades:
-        raise SemanticCommandError
-    grades[0].manager.delete()
+def get_grade_key(grade: Grade) -> tuple[int, int, datetime.date]:
+    """Ключ, по которому оценка из команды сопоставляется с оценкой из БД"""
+    return grade.value, get_pk_related_entry(grade.student), grade.date
+
+
+def get_pks_of_grades_to_remove(grades: list[Grade], saved_grades: Iterable[Grade]) -> list[int]:
+    """
+    Сопоставляет каждой оценке из команды свою оценку из БД.
+    Если для какой-то оценки из команды оценки в БД нет, возбуждается исключение 'SemanticCommandError'
+    """
+    saved_grades_pks = defaultdict(list)
+    for grade in saved_grades:
+        saved_grades_pks[get_grade_key(grade)].append(grade.pk)
+    pks = []
+    for grade in grades:
+        if not saved_grades_pks[get_grade_key(grade)]:
+            raise SemanticCommandError
+        pks.append(saved_grades_pks[get_grade_key(grade)].pop())
+    return pks
 
 
 def remove_grades_from_grading_command(preliminary_grades: list[tuple[Student, list[Grade]]]) -> None:
-    iterate_over_preliminary_grades(preliminary_grades, remove_one_grade_from_grading_command)
+    grades = get_grades_from_preliminary_grades(preliminary_grades)
+    if not grades:
+        return
+    saved_grades = Grade.manager.filter(subject=grades[0].subject, student__in=[grade.student for grade in grades],
+                                        date__in=[grade.date for grade in grades])
+    Grade.manager.filter(pk__in=get_pks_of_grades_to_remove(grades, saved_grades)).delete()
 
 
 what_to_do_with_grades_choices = {WhatToDoWithGrades.add: (save_grades_from_grading_command, 'добавление'),
@@ -446,10 +541,11 @@ def request_value_to_create_obj_by_admin(model_class: Type[BaseModel], attr_en:
     if attr_en in model_class.related_data:
         related_model = model_class.related_data[attr_en]
         related_objs = get_all_objects_for_any_model(related_model)
-        if not related_objs:
-            raise NoObjsToChooseFrom('Нет зависимых объектов для выбора')
         related_model_str_ru = get_noun_form(attr_ru)
-        return get_obj_from_user(related_objs, related_model_str_ru)
+        try:
+            return get_obj_from_user_by_pages(related_objs, related_model_str_ru)
+        except NoObjsToChooseFrom:
+            raise NoObjsToChooseFrom('Нет зависимых объектов для выбора')
     elif attr_en == 'password':
         return get_answer(f'Введите поле \'{attr_ru}\':', getpass)
     elif attr_en == 'is_current':
@@ -506,10 +602,10 @@ def warn_user_about_dependent_models(model_class: Union[Teacher, Class, Subject,
 def get_obj_from_user_for_admin_work(model_class: model_classes_for_admin_work,
                                      msg: str) -> Union[models_for_admin_work, None]:
     objs = get_all_objects_for_any_model(model_class)
-    if not objs:
+    try:
+        return get_obj_from_user_by_pages(objs, 'объект')
+    except NoObjsToChooseFrom:
         print(msg)
-        return
-    return get_obj_from_user(objs, 'объект')
 
 
 def get_attrs_to_change(obj: BaseModel) -> dict[str, str]:
@@ -521,7 +617,7 @@ def get_attrs_to_change(obj: BaseModel) -> dict[str, str]:
     return attrs_to_change
 
 
-def get_all_objects_for_any_model(model_class: Type[BaseModel]) -> list[BaseModel]:
+def get_all_objects_for_any_model(model_class: Type[BaseModel]) -> QuerySet:
     if model_class in (Student, Teacher):
         return model_class.manager.filter(is_active=True)
     return model_class.manager.all()
@@ -4,7 +4,7 @@ from user_interaction.messages import profile_type_msg, print_obj_with_this_data
     make_period_current_choice_msg, activate_user_choice_msg
 from user_interaction.services import *
 from user_interaction.services import create_dict_with_user_data, profiles, try_to_insert_obj_to_db
-from working_with_models.models import User, SubjectClassTeacher, Grade
+from working_with_models.models import User
 
 
 def authenticate_user() -> Optional[User]:
@@ -17,7 +17,8 @@ def authenticate_user() -> Optional[User]:
         print_error('Неправильный email или пароль\nПовторите процедуру аутентификации еще раз')
         return
     model_class = profiles[type_profile]
-    user = model_class.manager.get(email=email)
+    users = model_class.manager.filter(email=email).defer(None)
+    user = users[0] if users else None
     if not user or user.password != get_password_hash(user.second_name + password + user.email):
         print_error('Неправильный email или пароль\nПовторите процедуру аутентификации еще раз')
         return
@@ -59,13 +60,14 @@ def logout() -> None:
 
 
 def show_grades(student: Optional[User] = None) -> None:
-    """Показывает все оценки ученика за текущий период (атрибут 'current_dates' класса State)"""
+    """Показывает все оценки ученика за текущий период (атрибут 'current_period' класса State)"""
 
     if student is None:
         student = State.user
-    subjects = get_objs_from_sct(SubjectClassTeacher.manager.filter(school_class=student.school_class), 'subject')
+    subjects_classes_teachers = get_class_subjects(student.school_class).enqueue()
+    grades = get_student_grades(student).enqueue()
+    subjects = get_objs_from_sct(subjects_classes_teachers, 'subject')
     raw_table = get_empty_table_dict(subjects)
-    grades = Grade.manager.filter(student=student)
     fill_raw_table_with_grades(raw_table, grades, 'subject')
     pretty_table = get_pretty_table()
     prepare_pretty_table_for_grades(pretty_table, subjects)
@@ -79,7 +81,8 @@ def get_my_teachers() -> None:
     pretty_table = get_pretty_table()
     prepare_pretty_table_for_tchs_list(pretty_table)
     student_class = State.user.school_class
-    teachers_subjects = SubjectClassTeacher.manager.filter(school_class=student_class)
+    teachers_subjects = get_class_subjects(student_class).values_list(
+        'subject__name', 'teacher__second_name', 'teacher__first_name', 'teacher__patronymic')
     fill_pretty_table_with_tchs(pretty_table, teachers_subjects)
     print(pretty_table)
 
@@ -105,7 +108,7 @@ def rate_students_by_administrator() -> None:
 def print_school_class_grades(school_class: Class) -> None:
     """Печатает успеваемость класса без возможности редактировать оценки"""
 
-    subjects = get_objs_from_sct(SubjectClassTeacher.manager.filter(school_class=school_class), 'subject')
+    subjects = get_objs_from_sct(get_class_subjects(school_class), 'subject')
     subject = get_obj_from_user(subjects, 'предмет')
     print_class_grades_table(school_class, subject)
 
@@ -113,7 +116,7 @@ def print_school_class_grades(school_class: Class) -> None:
 def print_grades_of_student(school_class: Class) -> None:
     """Печатает успеваемость одного ученика без возможности редактировать оценки"""
 
-    students = sorted(Student.manager.filter(school_class=school_class, is_active=True), key=lambda x: x.second_name)
+    students = get_class_students(school_class)
     student = get_obj_from_user(students, 'ученика')
     print(f'Успеваемость {student}:')
     show_grades(student)
@@ -193,11 +196,11 @@ def change_obj_by_admin(model_class: model_classes_for_admin_work) -> None:
 def set_current_dates_by_admin() -> None:
     """Позволяет администратору изменить текущий период успеваемости"""
 
-    periods = Period.manager.filter(is_current=False)
-    if not periods:
+    try:
+        new_current_period = get_obj_from_user_by_pages(Period.manager.filter(is_current=False), 'период')
+    except NoObjsToChooseFrom:
         print_error('Существует только один период успеваемости, и сейчас он текущий')
         return
-    new_current_period = get_obj_from_user(periods, 'период')
     make_period_current_choice_msg(new_current_period)
     if get_choice(SaveChanges) is SaveChanges.no:
         return
@@ -216,10 +219,10 @@ def activate_users() -> None:
     model_classes = {'учитель': Teacher, 'ученик': Student}
     model_class = get_obj_from_user(list(model_classes.keys()), 'тип пользователя')
     users = model_classes[model_class].manager.filter(is_active=False)
-    if not users:
+    if not users.exists():
         print('Все пользователи активированы!')
         return
-    user = get_obj_from_user(users, 'пользователя')
+    user = get_obj_from_user_by_pages(users, 'пользователя')
     user.is_active = True
     activate_user_choice_msg(user)
     if try_to_insert_obj_to_db(user, 'save'):
@@ -1,3 +1,4 @@
+from db_interaction.identity_map import session
 from user_interaction.enums import WhatToDoWithLogin, teacher_main_menu_choice, \
     student_main_menu_choice, administrator_main_menu_choice, ManageClassPerformanceChoices, \
     ManageSchoolPerformanceChoices, WhatToDoWithObj
@@ -7,7 +8,8 @@ from user_interaction.messages import authenticate_user_msg, \
     manage_class_performance_choices_msg, manage_school_performance_choices_msg, what_to_do_with_obj_msg, \
     possible_actions_msg
 from user_interaction.requesting_data_from_user import get_choice
-from user_interaction.services import State, get_obj_from_user
+from user_interaction.services import State, get_obj_from_user, get_obj_from_user_by_pages, \
+    get_classes_of_classroom_teacher
 from user_interaction.user_actions import authenticate_user, register_user, logout, show_grades, get_my_teachers, \
     rate_students_by_teacher, print_school_class_grades, print_grades_of_student, \
     rate_students_by_administrator, remove_obj_by_admin, change_obj_by_admin, create_obj_by_admin, \
@@ -40,14 +42,15 @@ def main_menu() -> None:
     main_menu_msg()
     action_set, choices, main_menu_choices_msg = user_actions_and_choices[State.user.__class__.__name__]
     what_to_do_choice = get_choice(choices, main_menu_choices_msg)
-    action_set[what_to_do_choice.name]()
+    with session():
+        action_set[what_to_do_choice.name]()
 
 
 def manage_class_performance() -> None:
     """Пункт меню 'Классное руководство'"""
 
     separate_action()
-    school_classes = Class.manager.filter(classroom_teacher=State.user)
+    school_classes = get_classes_of_classroom_teacher(State.user)
     if not school_classes:
         print_error('У вас нет ни одного класса!')
     school_class = get_obj_from_user(school_classes, 'класс')
@@ -62,8 +65,7 @@ def manage_school_performance() -> None:
     if what_to_do_choice is ManageSchoolPerformanceChoices.rate_student:
         rate_students_by_administrator()
     else:
-        school_classes = Class.manager.all()
-        school_class = get_obj_from_user(school_classes, 'класс')
+        school_class = get_obj_from_user_by_pages(Class.manager.all(), 'класс')
         print_grades_of_student(school_class)
 
 
@@ -1,34 +1,164 @@
 import datetime
-from abc import ABC, abstractmethod
+from abc import ABCMeta, abstractmethod
 from typing import Generator, Any, Union
 
-from other.utils import ClassOrInstanceProperty
-from working_with_models.validators import EmailValidator, PersonalDataValidator, \
+from other.utils import ClassOrInstanceProperty, update_db_state
+from working_with_models.validators import BaseValidator, EmailValidator, PersonalDataValidator, \
     ClassNumberValidator, ClassLetterValidator, SubjectNameValidator, GradeValueValidator, PasswordValidator
 
 pk_obj = int
 
 
-class BaseModel(ABC):
-    """Базовый класс модели"""
+class ModelMeta(ABCMeta):
+    """
+    Метакласс моделей. Модель, объявленная с параметром 'compact=True'
+    (class Grade(BaseModel, compact=True)), хранит значения атрибутов в слотах ('__slots__'),
+    а не в словаре экземпляра, что уменьшает расход памяти на каждый объект.
+    Значение атрибута с валидатором хранится в слоте '_<имя атрибута>', валидация при присваивании сохраняется.
+    Слот '_db_state' хранит значения атрибутов, записанные в БД (см. 'BaseModel'), '_db_state_version' -
+    число исполненных к тому моменту 'QuerySet.update', слот '_prefetched_objects' - записи обратных связей,
+    загруженные 'QuerySet.prefetch_related'.
+    'bulk_updates_count' - число исполненных 'QuerySet.update' модели, 'attributes_updated_in_bulk' -
+    номер последнего из них для каждого измененного атрибута: записанные значения атрибута
+    у объектов, загруженных до него, неактуальны
+
+    'storage_names' - имена, под которыми хранятся значения атрибутов из 'attributes'.
+    Для каждой связи из 'related_data' связанная модель получает обратную связь '<имя модели>_set'
+    (например, 'Class.student_set'), описание которой хранится в 'reverse_related_data'
+    """
+
+    def __new__(mcs, name: str, bases: tuple[type, ...], namespace: dict[str, Any], compact: bool = False):
+        if compact:
+            attributes = namespace.get('attributes', getattr(bases[0], 'attributes', ()))
+            storage_names = get_storage_names(attributes, bases, namespace)
+            namespace['__slots__'] = storage_names + ('_db_state', '_db_state_version', '_prefetched_objects')
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls.compact = compact
+        cls.storage_names = storage_names if compact else getattr(cls, 'attributes', ())
+        cls.reverse_related_data = {}
+        cls.bulk_updates_count = 0
+        cls.attributes_updated_in_bulk = {}
+        for attr, related_model in namespace.get('related_data', {}).items():
+            reverse_relation = ReverseRelation(cls, attr, f'{name.lower()}_set')
+            related_model.reverse_related_data[reverse_relation.name] = reverse_relation
+            setattr(related_model, reverse_relation.name, reverse_relation)
+        if compact:
+            for attr, storage_name in zip(cls.attributes, cls.storage_names):
+                if attr != storage_name:
+                    setattr(cls, attr, CompactField(getattr(cls, attr), getattr(cls, storage_name)))
+        return cls
+
+
+class CompactField:
+    """
+    Атрибут компактной модели, у которого есть валидатор.
+    Значение читается из слота, а присваивание проходит через валидатор
+    """
+
+    def __init__(self, validator: BaseValidator, slot: Any) -> None:
+        self.validator = validator
+        self.slot = slot
+
+    def __get__(self, instance: 'BaseModel', owner: type = None) -> Any:
+        if instance is None:
+            return self.validator
+        return self.slot.__get__(instance, owner)
+
+    def __set__(self, instance: 'BaseModel', value: Any) -> None:
+        self.validator.__set__(instance, value)
+
+
+class ReverseRelation:
+    """
+    Обратная связь: записи модели 'model', которые ссылаются на экземпляр через атрибут 'attr'.
+    Возвращает записи, загруженные 'QuerySet.prefetch_related', а если они не загружены - набор записей,
+    который выбирается из БД отдельным запросом
+    """
+
+    def __init__(self, model: type, attr: str, name: str) -> None:
+        self.model = model
+        self.attr = attr
+        self.name = name
+
+    def __get__(self, instance: 'BaseModel', owner: type = None) -> Any:
+        if instance is None:
+            return self
+        prefetched_objects = getattr(instance, '_prefetched_objects', {})
+        if self.name in prefetched_objects:
+            return prefetched_objects[self.name]
+        return self.model.manager.filter(**{self.attr: instance})
+
+    def set_prefetched(self, instance: 'BaseModel', objs: list['BaseModel']) -> None:
+        prefetched_objects = getattr(instance, '_prefetched_objects', None)
+        if prefetched_objects is None:
+            prefetched_objects = {}
+            object.__setattr__(instance, '_prefetched_objects', prefetched_objects)
+        prefetched_objects[self.name] = objs
+
+
+def get_storage_names(attributes: tuple[str, ...], bases: tuple[type, ...],
+                      namespace: dict[str, Any]) -> tuple[str, ...]:
+    def has_validator(attr: str) -> bool:
+        if attr in namespace:
+            return isinstance(namespace[attr], BaseValidator)
+        return any(isinstance(vars(klass).get(attr), BaseValidator) for base in bases for klass in base.__mro__)
+
+    return tuple(f'_{attr}' if has_validator(attr) else attr for attr in attributes)
+
+
+class BaseModel(metaclass=ModelMeta):
+    """
+    Базовый класс модели.
+    Модель, полученная из БД, помнит значения атрибутов, записанные в БД ('_db_state'),
+    поэтому 'save' записывает только изменившиеся атрибуты
+    """
+
+    __slots__ = ()
 
     _manager = None
     attributes = ('pk',)
     related_data = {}
+    deferred_fields = ()
 
     def __init__(self) -> None:
         self.pk = None
 
     def __iter__(self) -> Generator[tuple[str, Any], None, None]:
-        for key, value in self.__dict__.items():
-            yield key, value
+        """Перебирает загруженные атрибуты. Отложенные атрибуты не загружаются"""
+        if not self.compact:
+            yield from ((attr, value) for attr, value in self.__dict__.items() if not attr.startswith('_'))
+            return
+        for attr, storage_name in zip(self.attributes, self.storage_names):
+            try:
+                yield attr, object.__getattribute__(self, storage_name)
+            except AttributeError:
+                continue
+
+    def __getattr__(self, attr: str) -> Any:
+        """
+        Вызывается, если атрибут не загружен. Отложенный атрибут ('only', 'defer', 'deferred_fields')
+        модели, полученной из БД, загружается отдельным запросом при первом обращении.
+        Запрос выполняется для каждого атрибута каждого объекта и исполняет всю очередь запросов
+        экземпляра класса 'Database' (в том числе еще не исполненные запросы на запись), поэтому
+        атрибуты, нужные для многих объектов, следует выбирать сразу ('only', 'defer(None)')
+        """
+        if attr == 'pk' or attr not in self.attributes or object.__getattribute__(self, 'pk') is None:
+            raise AttributeError(attr)
+        value = self.__class__.manager.filter(pk=self.pk).values_list(attr, flat=True)[0]
+        storage_name = self.storage_names[self.attributes.index(attr)]
+        if self.compact:
+            object.__setattr__(self, storage_name, value)
+        else:
+            self.__dict__[storage_name] = value
+        update_db_state(self, (storage_name,), (value,))
+        return value
 
     def __repr__(self):
         s = ', '.join(f'{attr}: {value}' for attr, value in self)
         return f'{self.__class__.__name__}({s})'
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return self is other or hash(self) == hash(other)
 
     @ClassOrInstanceProperty
     def manager(self) -> 'TablesManager':
@@ -44,6 +174,8 @@ class BaseModel(ABC):
 class User:
     """Базовое представление пользователя"""
 
+    __slots__ = ()
+
     attributes = BaseModel.attributes + ('first_name', 'second_name', 'patronymic', 'email', 'password')
     attributes_ru = ('имя', 'фамилия', 'отчество', 'email', 'пароль')
 
@@ -75,6 +207,7 @@ class Teacher(User, BaseModel):
     db_table = 'teachers'
     attributes = User.attributes + ('about_person', 'is_active')
     attributes_ru = User.attributes_ru + ('об учителе', 'активный ли учитель')
+    deferred_fields = ('password', 'about_person')
     name_ru = 'учитель'
 
     def __init__(self, first_name: str, second_name: str, patronymic: str,
@@ -115,6 +248,7 @@ class Student(User, BaseModel):
     db_table = 'students'
     attributes = User.attributes + ('school_class', 'is_active')
     attributes_ru = User.attributes_ru + ('класс', 'активный ли ученик')
+    deferred_fields = ('password',)
     related_data = {'school_class': Class}
     name_ru = 'ученик'
 
@@ -163,8 +297,8 @@ class Subject(BaseModel):
         return hash(self.name)
 
 
-class Grade(BaseModel):
-    """Модель школьной оценки"""
+class Grade(BaseModel, compact=True):
+    """Модель школьной оценки. Оценок в БД больше всего, поэтому модель компактная (см. 'ModelMeta')"""
 
     db_table = 'grades'
     attributes = BaseModel.attributes + ('value', 'student', 'subject', 'date')
@@ -9,6 +9,7 @@ class BaseValidator:
 
     def __set_name__(self, owner: 'BaseModel', name: str) -> None:
         self.name = name
+        self.storage_name = f'_{name}'
         self.name_ru = owner.attributes_ru[owner.attributes.index(name) - 1]
 
     def check_for_characters(self, value: str, characters: Iterable) -> None:
@@ -26,8 +27,20 @@ class BaseValidator:
             raise ValidationError(f'Неккореткное значение поля \'{self.name_ru}\'. '
                                   f'Допустимый диапозон - [{min_length}; {max_length}]')
 
+    def __get__(self, instance: 'BaseModel', owner: type = None) -> Any:
+        """Незагруженный атрибут модели, полученной из БД, загружается при первом обращении (см. 'BaseModel')"""
+        if instance is None or not hasattr(owner, 'attributes'):
+            return self
+        if self.name in instance.__dict__:
+            return instance.__dict__[self.name]
+        return instance.__getattr__(self.name)
+
     def __set__(self, instance: 'BaseModel', value: Any) -> None:
-        instance.__dict__[self.name] = value
+        """У компактной модели значение хранится в слоте 'storage_name' (см. 'ModelMeta')"""
+        if getattr(instance, 'compact', False):
+            setattr(instance, self.storage_name, value)
+        else:
+            instance.__dict__[self.name] = value
 
 
 class PersonalDataValidator(BaseValidator):